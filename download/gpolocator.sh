@@ -1,6 +1,8 @@
 # Download and unzip all uscode files for a year.
 # Run it from the uscode folder. Specify a year on
 # the command line eg: download/gpolocator.sh 2011
+# Pass --zip after the year to keep the zip archives
+# instead of extracting them; the parser can read them.
 DIR=`pwd`"/data"
 DEST="$DIR/uscode.house.gov/zip/$1/"
 #echo $DIR
@@ -8,6 +10,8 @@ DEST="$DIR/uscode.house.gov/zip/$1/"
 mkdir -P $DIR
 wget -m -l1 -P $DIR http://uscode.house.gov/zip/$1
 cd $DEST
-for filename in `ls`; do unzip $filename; done
-find . -type f -name "*zip" -delete
+if [ "$2" != "--zip" ]; then
+  for filename in `ls`; do unzip $filename; done
+  find . -type f -name "*zip" -delete
+fi
 cd $DIR
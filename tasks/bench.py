@@ -0,0 +1,279 @@
+# Microbenchmarks for the hot paths of the gpo locator parser, run against
+# the fixture titles checked in under test/fixtures.
+#
+# Outputs JSON to STDOUT. Run and save with:
+#  ./run bench > bench.json
+#
+# options:
+#   repeat: How many times to time each benchmark (default 5)
+#   only: Run only the benchmarks whose names contain this (e.g. "enum")
+#   fixtures: Directory of gpo locator files to run against (default "test/fixtures")
+#   output: Write the JSON to this file instead of STDOUT
+#   compare: The JSON output of an earlier run; print how each benchmark's best time has changed since
+#
+# Each benchmark runs in a forked child process, so that its peak memory use
+# (the child's maximum resident set size, from os.wait4) doesn't include
+# whatever the benchmarks before it allocated. The child starts out with the
+# parent's maximum, recorded as "start_rss_kb".
+
+import os, sys, gc, glob, json, platform, resource, traceback
+import cStringIO
+from timeit import default_timer
+
+import uscode
+from uscode import schemes
+from uscode.structure import GPOLocatorParser
+
+
+def run(options):
+  repeat = int(options.get('repeat', 5))
+  only = options.get('only', None)
+  fixtures = options.get('fixtures', 'test/fixtures')
+
+  corpus = Corpus(fixtures)
+  if not corpus.fixtures:
+    print "No fixtures found in %s." % fixtures
+    return
+
+  results = {}
+  for name, bench in BENCHMARKS:
+    if only and (only not in name):
+      continue
+    if bench is None:
+      continue
+    results[name] = run_forked(bench, corpus, repeat)
+
+  output = {
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'repeat': repeat,
+    'fixtures': [name for name, data in corpus.fixtures],
+    'benchmarks': results,
+  }
+  output = json.dumps(output, sort_keys=True, indent=2)
+
+  if options.get('output', None):
+    with open(options['output'], 'w') as f:
+      f.write(output)
+  else:
+    print output
+
+  if options.get('compare', None):
+    with open(options['compare']) as f:
+      compare(json.load(f)['benchmarks'], results)
+
+
+# the data each benchmark works on, worked out once up front
+
+class Corpus(object):
+
+  def __init__(self, path):
+    self.fixtures = []
+    for filename in sorted(glob.glob(os.path.join(path, 'usc*'))):
+      if filename.endswith('.idx'):
+        continue
+      with open(filename, 'rb') as f:
+        self.fixtures.append((os.path.basename(filename), f.read()))
+
+    self.lines = [list(uscode.getlines(cStringIO.StringIO(data)))
+                  for name, data in self.fixtures]
+    self.sections = []
+    for lines in self.lines:
+      self.sections.extend(uscode.File(lines=lines).iter_sections())
+    self.body_lines = [list(section.body_lines()) for section in self.sections]
+
+    # every enum occurrence's text, and each pair of enums that follow
+    # one another in a section
+    self.enum_texts = []
+    self.enum_pairs = []
+    for body_lines in self.body_lines:
+      texts = [enum.original_text for enum, text, line, nested in body_lines
+               if enum is not None]
+      self.enum_texts.extend(texts)
+      self.enum_pairs.extend(zip(texts, texts[1:]))
+    self.token_texts = [token.text for text in self.enum_texts
+                        for token in schemes.Enum(text)
+                        if token.text != '-']
+
+
+def clear_caches():
+  schemes.Enum._interned.clear()
+  schemes.Token._interned.clear()
+  schemes._transitions.clear()
+
+
+# each benchmark does its (untimed) setup and returns the function to time,
+# along with the number of items that function processes
+
+def bench_enum_init(corpus):
+  clear_caches()
+  texts = corpus.enum_texts
+  Enum = schemes.Enum
+  def func():
+    for text in texts:
+      Enum(text)
+  return func, len(texts)
+
+def bench_enum_get(corpus):
+  clear_caches()
+  texts = corpus.enum_texts
+  get = schemes.Enum.get
+  def func():
+    for text in texts:
+      get(text)
+  return func, len(texts)
+
+def bench_get_schemes(corpus):
+  tokens = [schemes.Token(text) for text in corpus.token_texts]
+  def func():
+    for token in tokens:
+      token.get_schemes()
+  return func, len(tokens)
+
+def bench_get_ordinality(corpus):
+  tokens = [schemes.Token(text) for text in corpus.token_texts]
+  for token in tokens:
+    token.get_schemes()
+  def func():
+    for token in tokens:
+      token.get_ordinality()
+  return func, len(tokens)
+
+def bench_could_be_next_after(corpus):
+  Enum = schemes.Enum
+  pairs = [(Enum(prev), Enum(next_)) for prev, next_ in corpus.enum_pairs]
+  def func():
+    for prev, next_ in pairs:
+      next_.could_be_next_after(prev)
+  return func, len(pairs)
+
+def bench_could_be_next(corpus):
+  clear_caches()
+  get = schemes.Enum.get
+  pairs = [(get(prev), get(next_)) for prev, next_ in corpus.enum_pairs]
+  could_be_next = schemes.could_be_next
+  def func():
+    for prev, next_ in pairs:
+      could_be_next(prev, next_)
+  return func, len(pairs)
+
+def bench_could_be_next_many(corpus):
+  clear_caches()
+  prevs = [prev for prev, next_ in corpus.enum_pairs]
+  nexts = [next_ for prev, next_ in corpus.enum_pairs]
+  def func():
+    schemes.could_be_next_many(prevs, nexts)
+  return func, len(prevs)
+
+def bench_getlines(corpus):
+  datas = [data for name, data in corpus.fixtures]
+  def func():
+    for data in datas:
+      for line in uscode.getlines(cStringIO.StringIO(data)):
+        pass
+  return func, sum(map(len, corpus.lines))
+
+def bench_group(corpus):
+  def func():
+    for lines in corpus.lines:
+      uscode.group(lines)
+  return func, sum(map(len, corpus.lines))
+
+def bench_parse(corpus):
+  clear_caches()
+  def func():
+    for body_lines in corpus.body_lines:
+      GPOLocatorParser(body_lines).parse()
+  return func, sum(map(len, corpus.body_lines))
+
+try:
+  import numpy
+except ImportError:
+  bench_could_be_next_many = None
+
+BENCHMARKS = [
+  ('enum_init', bench_enum_init),
+  ('enum_get', bench_enum_get),
+  ('get_schemes', bench_get_schemes),
+  ('get_ordinality', bench_get_ordinality),
+  ('could_be_next_after', bench_could_be_next_after),
+  ('could_be_next', bench_could_be_next),
+  ('could_be_next_many', bench_could_be_next_many),
+  ('getlines', bench_getlines),
+  ('group', bench_group),
+  ('parse', bench_parse),
+]
+
+
+# timing
+
+def measure(bench, corpus, repeat):
+  times = []
+  for n in xrange(repeat):
+    func, items = bench(corpus)
+    # like timeit, keep the garbage collector out of the timings
+    gc.collect()
+    gc.disable()
+    try:
+      start = default_timer()
+      func()
+      times.append(default_timer() - start)
+    finally:
+      gc.enable()
+
+  ordered = sorted(times)
+  best = ordered[0]
+  return {
+    'items': items,
+    'times': times,
+    'best': best,
+    'median': ordered[len(ordered) // 2],
+    'mean': sum(times) / len(times),
+    'ns_per_item': best * 1e9 / items if items else None,
+  }
+
+def maxrss_kb(rusage):
+  # linux reports kilobytes, os x bytes
+  if sys.platform == 'darwin':
+    return rusage.ru_maxrss // 1024
+  return rusage.ru_maxrss
+
+def run_forked(bench, corpus, repeat):
+  if not hasattr(os, 'fork'):
+    return measure(bench, corpus, repeat)
+
+  read_fd, write_fd = os.pipe()
+  pid = os.fork()
+  if pid == 0:
+    status = 0
+    try:
+      os.close(read_fd)
+      start_rss = maxrss_kb(resource.getrusage(resource.RUSAGE_SELF))
+      result = measure(bench, corpus, repeat)
+      result['start_rss_kb'] = start_rss
+    except BaseException:
+      result = {'error': traceback.format_exc()}
+      status = 1
+    try:
+      with os.fdopen(write_fd, 'w') as f:
+        f.write(json.dumps(result))
+    finally:
+      os._exit(status)
+
+  os.close(write_fd)
+  with os.fdopen(read_fd) as f:
+    result = f.read()
+  pid, status, rusage = os.wait4(pid, 0)
+  result = json.loads(result) if result else {'error': 'exit status %d' % status}
+  result['peak_rss_kb'] = maxrss_kb(rusage)
+  if 'error' in result:
+    print >> sys.stderr, result['error']
+  return result
+
+def compare(before, after):
+  for name in sorted(after):
+    old, new = before.get(name, {}), after[name]
+    if not old.get('best') or not new.get('best'):
+      continue
+    change = (new['best'] - old['best']) / old['best'] * 100
+    print >> sys.stderr, "%-22s %10.6fs -> %10.6fs  %+6.1f%%" % (name, old['best'], new['best'], change)
@@ -0,0 +1,45 @@
+# Manage the cache of parsed title snapshots (see uscode/snapshot.py) that
+# ./run parse, ./run debug and the gitdump tasks load titles from.
+#
+# With no options, lists the snapshots in the cache and their total size.
+#
+# options:
+#   clear: Remove every snapshot, or with --title, just that title's
+#   title: With --clear, only remove the snapshot of this title (e.g. "26")
+#   year: The year of --title (default 2011)
+#   max-size: Evict the least recently used snapshots until the cache is no bigger than this many megabytes
+#   dir: The cache directory (default "data/cache/snapshots")
+
+import os
+import time
+
+import utils
+from uscode import snapshot
+
+
+def run(options):
+  cache_dir = options.get('dir', snapshot.CACHE_DIR)
+
+  if options.get('clear', False):
+    title = options.get('title', None)
+    if title:
+      filename = utils.title_filename(title, options.get('year', 2011))
+      if not os.path.exists(filename):
+        utils.log("This title has not been downloaded.")
+        return
+      removed = snapshot.clear(cache_dir, filename)
+    else:
+      removed = snapshot.clear(cache_dir)
+    utils.log("Removed %d snapshots." % len(removed))
+    return
+
+  if options.get('max-size', None):
+    max_bytes = int(float(options['max-size']) * (1 << 20))
+    removed = snapshot.evict(cache_dir, max_bytes)
+    utils.log("Evicted %d snapshots." % len(removed))
+
+  items = snapshot.snapshots(cache_dir)
+  for path, size, used in items:
+    utils.log("%s  %8.1f MB  last used %s" % (os.path.basename(path), size / float(1 << 20), time.ctime(used)))
+  total = sum(size for path, size, used in items)
+  utils.log("%d snapshots, %.1f MB in %s" % (len(items), total / float(1 << 20), cache_dir))
@@ -0,0 +1,38 @@
+# Write every title of an edition into one corpus file (see uscode/corpus.py),
+# which worker processes can map read-only and share, rather than each one
+# reading and tokenizing the titles itself.
+#
+# options:
+#   year: The edition to write (default 2011)
+#   output: Where to write it (default "data/cache/corpus/<year>.corpus")
+#   check: Don't write anything; list the titles that have changed since the corpus was written
+
+import os
+
+import utils
+from uscode import corpus, edition
+
+
+def run(options):
+  year = options.get('year', 2011)
+  path = options.get('output', corpus.corpus_filename(year))
+
+  if options.get('check', False):
+    if not os.path.exists(path):
+      utils.log("There's no corpus at %s." % path)
+      return
+    stale = corpus.attach(path).stale()
+    if stale:
+      utils.log("Changed since the corpus was written: %s" % ", ".join(stale))
+    else:
+      utils.log("The corpus at %s is current." % path)
+    return
+
+  filenames = edition.edition_filenames(year, utils.input_dir())
+  if not filenames:
+    utils.log("No titles of the %s edition have been downloaded." % year)
+    return
+
+  corpus.build_corpus(filenames, path)
+  size = os.path.getsize(path)
+  utils.log("Wrote %d titles to %s (%.1f MB)." % (len(filenames), path, size / float(1 << 20)))
@@ -3,7 +3,7 @@ import sys
 
 from logbook import Logger
 
-from uscode import File
+from uscode import title_for, cached_title_for
 from utils import title_filename
 
 
@@ -12,12 +12,14 @@ logger = Logger('debug')
 
 def run(options):
     filename = title_filename(int(options["title"]), '2011')
-    fp = open(filename)
 
-    gpo_file = File(fp)
+    if options.get('cache', True):
+        gpo_file = cached_title_for(filename)
+    else:
+        gpo_file = title_for(filename)
     succeeded = 0
     failed = 0
-    for section in gpo_file.sections():
+    for section in gpo_file.iter_sections():
         logger.info('Trying to parse %r' % section)
         try:
             tree = section.as_tree()
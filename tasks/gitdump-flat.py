@@ -5,14 +5,34 @@ from os.path import join
 import subprocess
 
 from logbook import Logger
-from uscode import File
+from uscode import iter_sections, cached_title_for, cache_edition
 import utils
 
 
 logger = Logger('debug')
 
+
+def title_sections(filename, cache=False):
+    '''Yield the sections of a title, streamed one at a time, or from
+    its snapshot (which loads the whole title) if `cache` is true.
+    Any failure to read or group it is logged rather than raised.
+    '''
+    try:
+        if cache:
+            sections = cached_title_for(filename).iter_sections()
+        else:
+            sections = iter_sections(filename)
+        for section in sections:
+            yield section
+    except Exception as e:
+        logger.critical('The parser failed on %r: %r' % (filename, e))
+
+
 def run(options):
     argv = options["argv"]
+    cache = options.get('cache', False)
+    processes = options.get('processes', None)
+    processes = int(processes) if processes else None
 
     args = [
         ('2011', '2006 Edition and Supplement V (2011)'),
@@ -54,6 +74,13 @@ def run(options):
     failed_objs = []
     for arg in reversed(args):
 
+        if cache:
+            # Parse the whole edition across the process pool up front, so
+            # each title below just loads its snapshot.
+            year = arg[0]
+            logger.info('Caching the %s edition ...' % year)
+            cache_edition(year, processes, utils.input_dir())
+
         for title in range(1, 51):
 
             year, commit_msg = arg
@@ -69,17 +96,10 @@ def run(options):
             else:
                 logger.info('created dir %s' % title_path)
 
-            try:
-                fp = open(filename)
-            except IOError as e:
-                logger.warning('No such file: %r: %r' % (filename, e))
-
-            try:
-                gpo_file = File(fp)
-            except Exception as e:
-                logger.critical('The parser failed on %r' % filename)
+            if not os.path.exists(filename):
+                logger.warning('No such file: %r' % filename)
 
-            for section in gpo_file.sections():
+            for section in title_sections(filename, cache):
                 try:
                     msg = 'Trying to parse %r' % section
                     # logger.info(msg)
@@ -4,7 +4,7 @@ import shutil
 from os.path import join
 import subprocess
 
-from uscode.parser import getlines
+from uscode import lines_for, cached_title_for
 from uscode.grouper import group
 from uscode.structure import GPOLocatorParser
 import utils
@@ -49,14 +49,16 @@ def run(options):
         title = int(argv[0])
         offset = int(argv[1])
         filename = utils.title_filename(title, year)
-        fp = open(filename)
-        lines = getlines(fp)
-        gg = group(lines)
+        if options.get('cache', True):
+            qq = cached_title_for(filename).instance(offset).as_tree()
+        else:
+            lines = lines_for(filename)
+            gg = group(lines)
 
-        ss = gg[offset].instance
-        bb = ss.body_lines()
-        xx = GPOLocatorParser(bb)
-        qq = xx.parse()
+            ss = gg[offset].instance
+            bb = ss.body_lines()
+            xx = GPOLocatorParser(bb)
+            qq = xx.parse()
 
         # try:
         #     shutil.rmtree(path)
@@ -1,4 +1,4 @@
-import os, json
+import os
 import utils
 import uscode
 
@@ -6,38 +6,75 @@ def run(options):
   title_number = options.get('title', None)
   # section = options.get('section', None)
   year = options.get('year', 2011) # default to 2011 for now
+  indent = None if options.get('compact', False) else 2
+
+  # --all parses every title of the year, spread across --processes worker
+  # processes (one per cpu by default)
+  if options.get('all', False):
+    processes = options.get('processes', None)
+    processes = int(processes) if processes else None
+    return parse_edition(year, processes, indent, options.get('cache', False))
 
   if not title_number:
-    utils.log("Supply a 'title' argument to parse a title.")
+    utils.log("Supply a 'title' argument to parse a title, or --all to parse every title.")
     return
 
   filename = utils.title_filename(title_number, year)
   if not os.path.exists(filename):
     utils.log("This title has not been downloaded.")
 
-  title = uscode.title_for(filename)
+  # stream the sections, grouping one at a time, so that even the biggest
+  # titles are never held in memory all at once. with --cache, sections and
+  # their trees come from the title's snapshot instead (see ./run cache),
+  # which is faster once it's been made but loads the whole title
+  if options.get('cache', False):
+    sections = uscode.cached_title_for(filename).iter_sections()
+  else:
+    sections = uscode.iter_sections(filename)
+
+  count = write_sections(sections, year, title_number, indent)
+  print "\nParsed %s sections of title %s." % (count, title_number)
+
 
-  sections = title.sections()
+def parse_edition(year, processes, indent, cache=False):
+  # each worker writes its title's json itself, and sends back only how
+  # many sections it wrote
+  titles = 0
+  failed = []
+  output_dir = "%s/%s" % (utils.output_dir(), year)
+  results = uscode.write_edition(year, output_dir, processes=processes, indent=indent,
+    input_dir=utils.input_dir(), cache=cache)
+  for result in results:
+    title_number = uscode.edition.title_number(result.filename)
+    if result.error is not None:
+      utils.log("[%s USC] Failed:\n%s" % (title_number, result.error))
+      failed.append(title_number)
+      continue
+    print "[%s USC] Parsed %s sections." % (title_number, result.count)
+    titles += 1
 
+  print "\nParsed %s titles of the %s edition." % (titles, year)
+  if failed:
+    print "Failed to parse titles: %s" % ", ".join(failed)
+
+
+def write_sections(sections, year, title_number, indent):
   count = 0
   for section in sections:
     section_number = section.enum()
     print "[%s USC %s] Parsing..." % (title_number, section_number)
 
-    # this could probably be black boxed a little further?
-    bb = section.body_lines()
-    xx = uscode.GPOLocatorParser(bb)
-    qq = xx.parse()
-    output = qq.json()
+    qq = section.as_tree()
 
-    utils.write(
-      json.dumps(output, sort_keys=True, indent=2), 
-      uscode_output(year, title_number, section_number)
-    )
+    # write the tree out as it's walked, rather than building the whole
+    # json document in memory first
+    destination = uscode_output(year, title_number, section_number)
+    utils.mkdir_p(os.path.dirname(destination))
+    with open(destination, 'w') as f:
+      qq.write_json(f, indent=indent)
 
     count += 1
-
-  print "\nParsed %s sections of title %s." % (count, title_number)
+  return count
 
 
 def uscode_output(year, title, section):
@@ -11,7 +11,8 @@
 #   debug: Output debug messages only, and no JSON output (dry run)
 #   force: Force a re-download of the US Code for the given year (script defaults to caching if the directory for a year is present)
 
-import glob, re, lxml.html, json, sys, os
+import glob, re, json, sys, os
+from lxml import etree
 
 import utils
 
@@ -20,6 +21,13 @@ pars = HTMLParser.HTMLParser()
 
 section_symbol = u'\xa7'
 
+# what lxml.html's text_content() does, for the plain elements iterparse makes
+text_content = etree.XPath("string()", smart_strings=False)
+
+expcite_pattern = re.compile(ur"<!-- expcite:(.*\S)\s*-->")
+excluded_pattern = re.compile(r"\[.*-(REPEALED|RESERVED|OMITTED|TRANSFERRED)\]\s*$", re.I)
+level_pattern = re.compile(r"(TITLE|SUBTITLE|CHAPTER|SUBCHAPTER|PART|SUBPART|DIVISION) ([^\-]+)-(.*)$|Secs?\. (.*)", re.I)
+
 
 def run(options):
   year = options.get("year", "uscprelim") # default to USCprelim
@@ -71,64 +79,93 @@ def run(options):
     if debug:
       print "[%s] Processing title..." % title
 
-    # Parse the XHTML file...
-    dom = lxml.html.parse(fn)
-    
-    # The file structure is flat. Loop through the XML
-    # nodes in this title.
-    for n in dom.find("body/div"):
+    for path, h3 in title_sections(fn):
+      # Insert the section into our TOC structure.
+      parse_h3(path, h3, TOC, title, sections_only)
+
+  # Sort the titles (take into account appendix notation).
+  TOC.sort(key = lambda title : (int(title[0][1].replace("a", "")), title[0][1]))
+  
+  # Reformat the output.
+  TOC = [reformat_structure(title) for title in TOC]
+
+  # Write output in JSON to stdout.
+  if debug:
+    print "\n(dry run only, not outputting)"
+  else:
+    json.dump(TOC, sys.stdout, indent=2, sort_keys=True, check_circular=False)
+  
+def title_sections(fn):
+  # Stream through the XHTML file rather than building its whole DOM, and
+  # yield the table of contents path and heading of each section.
+  #
+  # The file structure is flat: everything we need is an <h3> or a comment
+  # that's a child of the body's <div>, so only those are handed to us, and
+  # each child of the <div> is thrown away once we're past it.
+  content = None
+  path = None
+
+  for event, n in etree.iterparse(fn, events=("end", "comment"), tag=("h3", etree.Comment), html=True):
+    parent = n.getparent()
+    if content is None:
+      if is_content(parent):
+        content = parent
+      else:
+        continue
+    if parent is not content:
+      continue
+
+    if event == "comment":
       # Look for comments of the form <!-- expcite:... -->
       # This tells us the current table of contents location for the following <h3>.
-      m = re.match(ur"<!-- expcite:(.*\S)\s*-->", unicode(n))
+      m = expcite_pattern.match(u"<!--%s-->" % n.text)
       if m:
         # This is a "!@!"-separated string giving the table-of-contents
         # path to each section as we see it.
         expcite = m.group(1)
-        
+
         # These comments have HTML entities. Replace them with unicode.
         expcite = expcite.replace("&nbsp;", " ")
         expcite = pars.unescape(expcite)
-        
+
         # Parse the table of contents path.
         path = parse_expcite(expcite)
-            
-      elif n.tag == "h3":
-        # All headings are h3s. Check if it starts with the curly S section symbol.
-        h3 = n.text_content()
-        if not h3.startswith(section_symbol): continue
-        
+
+    else:
+      # All headings are h3s. Check if it starts with the curly S section symbol.
+      h3 = text_content(n)
+      if h3.startswith(section_symbol):
         # The most recent expcite path is the TOC location of this section.
         if not path: raise Exception("h3 without path")
-        
-        # Insert the section into our TOC structure.
-        parse_h3(path, h3, TOC, title, sections_only)
-        
+
+        yield path, h3
+
         # Clear so we don't reuse the path on the next h3.
         path = None
 
-  # Sort the titles (take into account appendix notation).
-  TOC.sort(key = lambda title : (int(title[0][1].replace("a", "")), title[0][1]))
-  
-  # Reformat the output.
-  TOC = [reformat_structure(title) for title in TOC]
+    # Done with this node and everything before it.
+    n.clear()
+    while n.getprevious() is not None:
+      del content[0]
+
+# is this the body's (first) <div>, which holds the whole title?
+def is_content(node):
+  if node is None or node.tag != "div":
+    return False
+  body = node.getparent()
+  return body is not None and body.tag == "body" and body.find("div") is node
 
-  # Write output in JSON to stdout.
-  if debug:
-    print "\n(dry run only, not outputting)"
-  else:
-    json.dump(TOC, sys.stdout, indent=2, sort_keys=True, check_circular=False)
-  
 def parse_expcite(expcite):
   path = expcite.split("!@!")
   
   # Parse each part of the path:
   for i in xrange(len(path)):
-    if re.match(r"\[.*-(REPEALED|RESERVED|OMITTED|TRANSFERRED)\]\s*$", path[i], re.I):
+    if excluded_pattern.match(path[i]):
       # This part is repealed. No need to process this path at all.
       path = None
       break
     
-    m = re.match(r"(TITLE|SUBTITLE|CHAPTER|SUBCHAPTER|PART|SUBPART|DIVISION) ([^\-]+)-(.*)$|Secs?\. (.*)", path[i], re.I)
+    m = level_pattern.match(path[i])
     if not m:
       # Some random text string. It's a part of a title with no level specifier.
       # We'll call it a "heading" level. In Title 50a, there are just names of
@@ -5,6 +5,8 @@ import pprint
 from pytz import timezone
 import datetime, time
 
+import uscode
+
 
 # scraper should be instantiated at class-load time, so that it can rate limit appropriately
 
@@ -21,8 +23,8 @@ def input_dir():
   return "data/uscode.house.gov/zip"
 
 def title_filename(title, year=2011):
-  year = str(year)
-  return os.path.join(input_dir(), year, 'usc%02d.%02d' % (int(title), int(year[2:])))
+  # falls back on the zip archive if the title was never extracted
+  return uscode.title_filename(title, year, input_dir())
 
 
 # general purpose
@@ -0,0 +1,40 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+fixture_names = ('usc08.11', 'usc26.11')
+
+
+def dump_title(title):
+    '''Return everything a File exposes that should survive a snapshot or
+    corpus: its lines, its documents' ranges and each section's tree.
+    '''
+    documents = title._grouped
+    lines = [line[:] for line in documents[0]._lines] if documents else []
+    ranges = [(doc.start, doc.stop, [tuple(s) for s in doc.subdocs], doc.id)
+              for doc in documents]
+    trees = [(section.enum(), section.as_tree().json())
+             for section in title.iter_sections()]
+    return lines, ranges, trees
+
+
+class FixtureTestCase(unittest.TestCase):
+    '''Works on copies of the fixtures, since loading a title writes its
+    sidecar index next to it.
+    '''
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.filenames = []
+        for name in fixture_names:
+            filename = os.path.join(self.tmp, name)
+            shutil.copy(os.path.join(here, 'fixtures', name), filename)
+            self.filenames.append(filename)
+        self.cache_dir = os.path.join(self.tmp, 'snapshots')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
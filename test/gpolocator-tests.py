@@ -15,7 +15,7 @@
 #             #self.assertEqual(data, _data)
 
 def main():
-    from gpolocator import schemes
+    from uscode import schemes
 
     import pdb;pdb.set_trace()
     schemes.Token('ll').get_schemes()
@@ -0,0 +1,39 @@
+import os
+import sys
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import uscode
+from uscode import corpus
+
+from common import FixtureTestCase, dump_title, fixture_names
+
+
+class TestCorpus(FixtureTestCase):
+
+    def test_titles_match_parse(self):
+        path = os.path.join(self.tmp, 'edition.corpus')
+        corpus.build_corpus(self.filenames, path)
+        mapped = corpus.Corpus(path)
+        self.assertEqual(mapped.names, list(fixture_names))
+        self.assertEqual(mapped.stale(), [])
+        for name, filename in zip(fixture_names, self.filenames):
+            self.assertEqual(dump_title(mapped.title(name)),
+                             dump_title(uscode.title_for(filename)))
+
+    def test_mapped_lines(self):
+        path = os.path.join(self.tmp, 'edition.corpus')
+        corpus.build_corpus(self.filenames, path)
+        mapped = corpus.Corpus(path)
+        lines = mapped.lines(fixture_names[0])
+        expected = [line[:] for line in uscode.lines_for(self.filenames[0])]
+        self.assertEqual(len(lines), len(expected))
+        self.assertEqual(lines[-1][:], expected[-1])
+        self.assertEqual([line[:] for line in lines[2:9:3]], expected[2:9:3])
+        self.assertRaises(IndexError, lines.__getitem__, len(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import json
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import uscode
+from uscode import edition
+
+from common import FixtureTestCase, dump_title
+
+
+class TestEdition(FixtureTestCase):
+
+    def setUp(self):
+        FixtureTestCase.setUp(self)
+        year_dir = os.path.join(self.tmp, '2011')
+        os.mkdir(year_dir)
+        for filename in self.filenames:
+            os.rename(filename,
+                      os.path.join(year_dir, os.path.basename(filename)))
+        # Named like a title, but it can't be read; it mustn't take the
+        # others down with it.
+        self.bad = os.path.join(year_dir, 'usc10.11')
+        os.mkdir(self.bad)
+        self.filenames = edition.edition_filenames(2011, self.tmp)
+
+    def test_map_titles(self):
+        self.assertEqual([os.path.basename(f) for f in self.filenames],
+                         ['usc08.11', 'usc10.11', 'usc26.11'])
+        for processes in (1, 2):
+            results = list(edition.map_titles(self.filenames, processes,
+                                              self.cache_dir))
+            # In order, whichever worker finished first.
+            self.assertEqual([res[0] for res in results], self.filenames)
+            for filename, data, error in results:
+                if filename == self.bad:
+                    self.assertEqual(data, None)
+                    self.assertTrue(error)
+                else:
+                    self.assertEqual(error, None)
+                    self.assertTrue(data)
+
+    def test_iter_edition(self):
+        results = list(uscode.iter_edition(2011, 2, self.tmp, self.cache_dir))
+        self.assertEqual([res.filename for res in results], self.filenames)
+        for res in results:
+            if res.filename == self.bad:
+                self.assertEqual(res.title, None)
+                self.assertTrue(res.error)
+            else:
+                self.assertEqual(res.error, None)
+                self.assertEqual(dump_title(res.title),
+                                 dump_title(uscode.title_for(res.filename)))
+
+    def test_cache_edition(self):
+        failed = uscode.cache_edition(2011, 2, self.tmp, self.cache_dir)
+        self.assertEqual([filename for filename, error in failed],
+                         [self.bad])
+
+    def test_write_edition(self):
+        output_dir = os.path.join(self.tmp, 'output')
+        for cache in (False, True):
+            results = list(uscode.write_edition(
+                2011, output_dir, 2, input_dir=self.tmp,
+                cache_dir=self.cache_dir, cache=cache))
+            self.assertEqual([res.filename for res in results],
+                             self.filenames)
+            counts = dict((edition.title_number(res.filename), res.count)
+                          for res in results)
+            self.assertEqual(counts, {'8': 3, '10': None, '26': 3})
+            self.assertTrue(results[1].error)
+
+            for filename in self.filenames[::2]:
+                number = edition.title_number(filename)
+                for section in uscode.iter_sections(filename):
+                    path = os.path.join(output_dir, number,
+                                        '%s.json' % section.enum())
+                    with open(path) as f:
+                        self.assertEqual(json.load(f),
+                                         section.as_tree().json())
+
+    def test_title_number(self):
+        self.assertEqual(edition.title_number('a/usc05a.11'), '5a')
+        self.assertEqual(edition.title_number('usc26.zip'), '26')
+
+
+if __name__ == '__main__':
+    unittest.main()
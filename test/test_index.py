@@ -0,0 +1,48 @@
+import os
+import sys
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import uscode
+from uscode import index
+
+from common import FixtureTestCase
+
+
+class TestSidecar(FixtureTestCase):
+
+    def test_rewrite_in_place_is_stale(self):
+        filename = self.filenames[0]
+        index.load_index(filename)
+        # Mapped from the sidecar this time.
+        old = index.load_index(filename)
+        self.assertTrue(index.is_current(old.header, filename))
+        old.close()
+        st = os.stat(filename)
+        with open(filename, 'rb') as f:
+            data = f.read()
+        # Same size and mtime, different contents.
+        with open(filename, 'wb') as f:
+            f.write(data.replace('TITLE', 'TITEL', 1))
+        os.utime(filename, (st.st_atime, st.st_mtime))
+        self.assertFalse(index.is_current(old.header, filename))
+        self.assertEqual(index.load_index(filename, build=False), None)
+
+    def test_indexed_lines_unmaps(self):
+        filename = self.filenames[0]
+        lines = uscode.indexed_lines(filename)
+        first = next(lines)
+        frame = lines.gi_frame
+        buf, idx = frame.f_locals['buf'], frame.f_locals['index']
+        self.assertEqual(len(list(lines)) + 1, len(idx))
+        self.assertEqual(idx.buf, None)
+        self.assertRaises(ValueError, buf.find, '\n')
+        # Lines hold their own bytes, so they outlive the map.
+        self.assertEqual(first.code, 'F')
+        self.assertTrue(first.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import sys
+import unittest
+import cStringIO
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import uscode
+from uscode import parser
+from uscode.index import LineIndex
+from uscode.structure import preorder
+
+
+def tokenize(text, **kwargs):
+    return list(parser.getlines(cStringIO.StringIO(text), **kwargs))
+
+
+class TestGetlines(unittest.TestCase):
+
+    def assertLines(self, text, expected):
+        for mapped in (False, True):
+            lines = tokenize(text, mapped=mapped)
+            self.assertEqual([(line.code, line.arg, line.data)
+                              for line in lines], expected, mapped)
+
+    def test_codes_with_arguments(self):
+        self.assertLines('\x07I74foo\r\n\x07F5800bar\r\n', [
+            ('I', '74', u'foo\r\n'),
+            ('F', '5800', u'bar\r\n'),
+            ])
+
+    def test_codes_without_arguments(self):
+        # The code stays at the start of the data, as it always has.
+        self.assertLines('\x07Kfoo\r\n\x07jbar\r\n\x07gsbaz\r\n', [
+            ('K', None, u'Kfoo\r\n'),
+            ('j', None, u'jbar\r\n'),
+            ('gs', None, u'gsbaz\r\n'),
+            ])
+
+
+class TestUnrecognized(unittest.TestCase):
+
+    text = '\x07Zqq\r\n\x07I74ok\r\n\x07Ix\r\n\r\n\x07Zrr\r\n'
+
+    def test_counted_not_dropped_silently(self):
+        # Unknown codes and a missing argument are skipped and tallied
+        # under their first two bytes; blank lines aren't counted.
+        for mapped in (False, True):
+            unrecognized = {}
+            lines = tokenize(self.text, mapped=mapped,
+                             unrecognized=unrecognized)
+            self.assertEqual([line[:2] for line in lines], [('I', '74')])
+            self.assertEqual(unrecognized, {'Zq': 1, 'Zr': 1, 'Ix': 1})
+
+    def test_index_counts(self):
+        index = LineIndex.build(self.text)
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.unrecognized, {'Zq': 1, 'Zr': 1, 'Ix': 1})
+
+
+class TestFootnotes(unittest.TestCase):
+
+    def test_refs(self):
+        line = parser.GPOLocatorLine(
+            'I', '11', 'Provisions\\1\\\x07N and more\\12\\\x07N.\r\n')
+        self.assertEqual(line.footnote_refs, (('1', 10), ('12', 24)))
+        self.assertEqual(line.text, u'Provisions and more.\r\n')
+        self.assertEqual(line.text.notes, [None, None])
+        line._footnote_dict = {'12': u'So in original.'}
+        self.assertEqual(line.text.notes, [None, u'So in original.'])
+
+        self.assertEqual(parser.find_footnote_refs(u'No markers.'), ())
+
+    def test_note(self):
+        line = parser.GPOLocatorLine('I', '28', '\x07N\\2\\ So in original.')
+        self.assertEqual(line.note, (u'2', u'So in original.'))
+        self.assertEqual(line.footnote_refs, ())
+        self.assertEqual(parser.parse_note(u'Not a note.'), None)
+
+    def test_tree_footnotes(self):
+        # Each note ends up on the node whose text has its marker.
+        with open(os.path.join(here, 'fixtures', 'usc08.11'), 'rb') as f:
+            title = uscode.File(f)
+        found = []
+        for section in title.iter_sections():
+            for node in preorder(section.as_tree()):
+                for note in getattr(node, 'footnotes', ()):
+                    found.append((section.enum(), node.enum.text,
+                                  note['number'], note['offset'],
+                                  note['text']))
+        self.assertEqual(found, [
+            ('1', 'a', '2', 23, u'So in original.\r\n'),
+            ('3', '7', '3', 10, u'See note.\r\n'),
+            ])
+
+
+if __name__ == '__main__':
+    unittest.main()
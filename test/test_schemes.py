@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+from uscode import schemes
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestTabledSchemes(unittest.TestCase):
+
+    def test_schemes_match_baseline(self):
+        # The schemes of every token in the original tables, as the
+        # original code classified them.
+        with open(os.path.join(here, 'fixtures', 'schemes-baseline.json')) as f:
+            baseline = json.load(f)
+        for text, expected in sorted(baseline.items()):
+            token = schemes.Token(str(text))
+            self.assertEqual(token.get_schemes(), set(expected), text)
+
+    def test_ordinals_match_tables(self):
+        for name, tokens in schemes._schemes_lists.items():
+            for n, text in enumerate(tokens):
+                ordinality = schemes.Token(text).get_ordinality()
+                self.assertEqual(ordinality[name], n, (name, text))
+
+    def test_repeated_letters_are_not_roman(self):
+        for text in ('cc', 'ccc', 'mm', 'mmm', 'CC', 'MM', 'MMMM'):
+            token = schemes.Token(text)
+            self.assertFalse(set(['lower_roman', 'upper_roman']) &
+                             token.get_schemes(), text)
+
+    def test_roman_past_table(self):
+        token = schemes.Token('lxxx')
+        self.assertEqual(token.get_schemes(), set(['lower_roman']))
+        self.assertEqual(token.get_ordinality(), {'lower_roman': 79})
+        token = schemes.Token('MCMXC')
+        self.assertEqual(token.get_ordinality(), {'upper_roman': 1989})
+
+
+class TestEnum(unittest.TestCase):
+
+    def test_tokens_and_format(self):
+        # As the original rgx-based tokenizer split them.
+        cases = [
+            ('(a)', ['a'], ['('], [')'], 'a'),
+            ('a.', ['a'], [], ['.'], 'a'),
+            ('1.2.', ['1.2'], [], ['.'], '1.2'),
+            ('4-a', ['4', '-', 'a'], [], [], '4-a'),
+            ('(12)(b)', ['12', 'b'], ['('], [')'], '12)(b'),
+            ('((A))', ['A'], ['(', '('], [')', ')'], 'A'),
+            ]
+        for text, tokens, left, right, stripped in cases:
+            enum = schemes.Enum(text)
+            self.assertEqual(list(enum), tokens, text)
+            self.assertEqual(enum.format_left, left, text)
+            self.assertEqual(enum.format_right, right, text)
+            self.assertEqual(enum.text, stripped, text)
+
+    def test_bad_text(self):
+        self.assertRaises(schemes.Enum.UnrecognizedTokenError,
+                          schemes.Enum, '$')
+        for text in ('()', '('):
+            self.assertRaises(IndexError, schemes.Enum, text)
+
+    def test_get_chain(self):
+        chain = schemes.Enum.get_chain('(B)(i)(1)')
+        self.assertEqual([enum.text for enum in chain], ['B', 'i', '1'])
+        for enum in chain:
+            self.assertTrue(enum is schemes.Enum.get(enum.text))
+        self.assertEqual(schemes.Enum.get_chain('no enums here'), [])
+        self.assertEqual(schemes.Enum.get_many(['B', 'i', '1']), chain)
+
+
+@unittest.skipIf(numpy is None, 'needs numpy')
+class TestBatch(unittest.TestCase):
+
+    texts = ['a', '$', 'ii', '()', '4-a', '1.2', 'B']
+
+    def test_get_schemes_many_matches_get_schemes(self):
+        masks, ordinals = schemes.get_schemes_many(self.texts)
+        for text, mask, row in zip(self.texts, masks, ordinals):
+            try:
+                enum = schemes.Enum(text)
+                expected = enum.get_schemes() or set()
+                ordinality = enum.get_ordinality() if expected else {}
+            except (schemes.Enum.UnrecognizedTokenError, IndexError,
+                    schemes.UnrecognizedSchemeError):
+                expected, ordinality = set(), {}
+            names = set(name for j, name in enumerate(schemes.scheme_names)
+                        if mask & (1 << j))
+            self.assertEqual(names, expected, text)
+            for j, name in enumerate(schemes.scheme_names):
+                if name in ordinality:
+                    self.assertEqual(row[j], ordinality[name][0], text)
+                else:
+                    self.assertEqual(row[j], -1, text)
+
+    def test_invalid_text_in_batch(self):
+        masks, ordinals = schemes.get_schemes_many(['a', '$', 'b'])
+        self.assertEqual(masks[1], 0)
+        self.assertTrue((ordinals[1] == -1).all())
+        self.assertTrue(masks[0] and masks[2])
+
+    def test_could_be_next_many(self):
+        prevs = ['a', 'a', '1', 'i', 'b']
+        nexts = ['b', 'c', '2', 'ii', 'a']
+        res = schemes.could_be_next_many(prevs, nexts)
+        expected = [bool(schemes.Enum(n).could_be_next_after(schemes.Enum(p)))
+                    for p, n in zip(prevs, nexts)]
+        self.assertEqual(list(res), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
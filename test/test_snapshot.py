@@ -0,0 +1,63 @@
+import os
+import sys
+import zlib
+import marshal
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import uscode
+from uscode import snapshot
+
+from common import FixtureTestCase, dump_title
+
+
+class TestSnapshot(FixtureTestCase):
+
+    def test_round_trip(self):
+        for filename in self.filenames:
+            documents, trees = snapshot.parse_title(uscode.lines_for(filename))
+            data = snapshot.encode(documents, trees, 'x' * 40)
+            lines, decoded, decoded_trees = snapshot.decode(data)
+            self.assertEqual(sorted(decoded_trees), sorted(trees))
+            for n, tree in trees.items():
+                self.assertEqual(decoded_trees[n].json(), tree.json())
+            title = uscode.File(lines=lines, documents=decoded,
+                                trees=decoded_trees)
+            self.assertEqual(dump_title(title),
+                             dump_title(uscode.title_for(filename)))
+
+    def test_cached_title_matches_parse(self):
+        for filename in self.filenames:
+            expected = dump_title(uscode.title_for(filename))
+            # Made the first time, then loaded.
+            for n in range(2):
+                title = uscode.cached_title_for(filename, self.cache_dir)
+                self.assertEqual(dump_title(title), expected)
+        self.assertEqual(len(snapshot.snapshots(self.cache_dir)), 2)
+
+    def test_bad_snapshots(self):
+        filename = self.filenames[0]
+        data = snapshot.snapshot_data(filename, self.cache_dir)
+        header, rest = data.split('\n', 1)
+        old = header.replace(' %d ' % snapshot.VERSION, ' 0 ', 1)
+        # A payload that unpacks, but whose tree points past the lines.
+        corrupt = zlib.compress(marshal.dumps(
+            (([], [], []), [], {'1': [(None, 99, [], 0)]})))
+        for bad in ('', 'junk', old + '\n' + rest, header + '\nnot zlib',
+                    header + '\n' + corrupt):
+            self.assertRaises(snapshot.SnapshotFormatError,
+                              snapshot.decode, bad)
+
+        # An unreadable snapshot is made again rather than used.
+        path, size, used = snapshot.snapshots(self.cache_dir)[0]
+        with open(path, 'wb') as f:
+            f.write('junk')
+        title = uscode.cached_title_for(filename, self.cache_dir)
+        self.assertEqual(dump_title(title),
+                         dump_title(uscode.title_for(filename)))
+
+
+if __name__ == '__main__':
+    unittest.main()
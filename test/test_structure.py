@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+import unittest
+import cStringIO
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import uscode
+from uscode import structure
+
+
+fixtures = [os.path.join(here, 'fixtures', name)
+            for name in ('usc08.11', 'usc26.11')]
+
+
+def section_trees(filename):
+    with open(filename, 'rb') as f:
+        title = uscode.File(f)
+    return [(section.enum(), section.as_tree())
+            for section in title.iter_sections()]
+
+
+class TestWriteJson(unittest.TestCase):
+
+    def assertParity(self, width, **kwargs):
+        for filename in fixtures:
+            trees = section_trees(filename)
+            self.assertTrue(trees)
+            for enum, tree in trees:
+                expected = json.dumps(tree.json(), sort_keys=True, **kwargs)
+                fp = cStringIO.StringIO()
+                tree.write_json(fp, indent=width)
+                self.assertEqual(fp.getvalue(), expected, (filename, enum))
+
+    def test_indented(self):
+        self.assertParity(2, indent=2)
+        self.assertParity(4, indent=4)
+
+    def test_zero_indent(self):
+        self.assertParity(0, indent=0)
+
+    def test_compact(self):
+        self.assertParity(None, separators=(',', ':'))
+
+
+class TestStream(unittest.TestCase):
+
+    def setUp(self):
+        self.pulled = []
+
+    def source(self, n):
+        for i in range(n):
+            self.pulled.append(i)
+            yield (i, 'text %d' % i, 'line %d' % i)
+
+    def test_lazy(self):
+        stream = structure.Stream(self.source(10))
+        self.assertEqual(self.pulled, [])
+        self.assertRaises(IndexError, stream.this)
+        self.assertEqual(next(stream).enum, 0)
+        self.assertEqual(self.pulled, [0])
+        self.assertEqual(stream.ahead(3).enum, 3)
+        self.assertEqual(self.pulled, [0, 1, 2, 3])
+        # Lookahead is handed out in order, not read twice.
+        self.assertEqual([next(stream).enum for i in range(4)], [1, 2, 3, 4])
+        self.assertEqual(self.pulled, range(5))
+        self.assertEqual(stream.this().enum, 4)
+        self.assertEqual(stream.i, 4)
+
+    def test_behind(self):
+        stream = structure.Stream(self.source(10), history=3)
+        for token in stream:
+            if token.enum == 6:
+                break
+        self.assertEqual(stream.previous().enum, 5)
+        self.assertEqual(stream.behind(3).enum, 3)
+        self.assertEqual(stream.behind(0).enum, 6)
+        self.assertEqual(stream.behind(-1).enum, 7)
+        self.assertEqual(stream.ahead(-2).enum, 4)
+        # Older tokens have been let go.
+        self.assertRaises(IndexError, stream.behind, 4)
+
+    def test_end(self):
+        stream = structure.Stream(self.source(2))
+        next(stream)
+        self.assertEqual(stream.ahead(1).enum, 1)
+        self.assertRaises(IndexError, stream.ahead, 2)
+        self.assertEqual([token.enum for token in stream], [1])
+
+
+def chain(depth):
+    '''Return the root of a tree of TextNodes `depth` deep.'''
+    root = node = structure.TextNode(u'0')
+    for n in range(1, depth):
+        child = structure.TextNode(unicode(n))
+        list.append(node, child)
+        node = child
+    return root
+
+
+class TestWalk(unittest.TestCase):
+
+    def setUp(self):
+        TextNode = structure.TextNode
+        self.root = root = TextNode(u'root')
+        self.a, self.b, self.c = a, b, c = map(TextNode, u'abc')
+        list.append(root, a)
+        list.append(a, b)
+        list.append(root, c)
+
+    def test_walk(self):
+        events = [(event, node.content, depth)
+                  for event, node, depth in structure.walk(self.root)]
+        self.assertEqual(events, [
+            ('start', 'root', 0),
+            ('start', 'a', 1),
+            ('start', 'b', 2),
+            ('end', 'b', 2),
+            ('end', 'a', 1),
+            ('start', 'c', 1),
+            ('end', 'c', 1),
+            ('end', 'root', 0),
+            ])
+
+    def test_orders(self):
+        root, a, b, c = self.root, self.a, self.b, self.c
+        self.assertEqual(list(structure.preorder(root)), [root, a, b, c])
+        self.assertEqual(list(structure.postorder(root)), [b, a, c, root])
+
+    def test_deep_tree(self):
+        # Deeper than the recursion limit.
+        depth = sys.getrecursionlimit() * 2
+        root = chain(depth)
+        self.assertEqual(len(list(structure.preorder(root))), depth)
+        data, n = root.json(), 0
+        while data['sub']:
+            data, n = data['sub'][0], n + 1
+        self.assertEqual(n, depth - 1)
+        fp = cStringIO.StringIO()
+        root.write_json(fp, indent=None)
+        self.assertEqual(fp.getvalue().count('"textnode"'), depth)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import sys
+import zipfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import uscode
+
+from common import FixtureTestCase, dump_title
+
+
+class TestZip(FixtureTestCase):
+
+    def setUp(self):
+        FixtureTestCase.setUp(self)
+        self.year_dir = os.path.join(self.tmp, '2011')
+        os.mkdir(self.year_dir)
+        self.archive = os.path.join(self.year_dir, 'usc08.zip')
+        with zipfile.ZipFile(self.archive, 'w') as archive:
+            archive.write(self.filenames[0], 'usc08.11')
+
+    def test_open_title(self):
+        with open(self.filenames[0], 'rb') as f:
+            expected = f.read()
+        self.assertEqual(uscode.open_title(self.archive).read(), expected)
+
+    def test_title_for(self):
+        self.assertEqual(dump_title(uscode.title_for(self.archive)),
+                         dump_title(uscode.title_for(self.filenames[0])))
+
+    def test_filenames(self):
+        self.assertEqual(uscode.title_filename(8, 2011, self.tmp),
+                         self.archive)
+        self.assertEqual(uscode.title_filenames(self.year_dir),
+                         [self.archive])
+
+        # An extracted title wins over its archive.
+        extracted = os.path.join(self.year_dir, 'usc08.11')
+        os.rename(self.filenames[0], extracted)
+        self.assertEqual(uscode.title_filename(8, 2011, self.tmp), extracted)
+        self.assertEqual(uscode.title_filenames(self.year_dir), [extracted])
+
+
+class TestLoadSection(FixtureTestCase):
+
+    def setUp(self):
+        FixtureTestCase.setUp(self)
+        year_dir = os.path.join(self.tmp, '2011')
+        os.mkdir(year_dir)
+        self.filename = os.path.join(year_dir, 'usc26.11')
+        os.rename(self.filenames[1], self.filename)
+
+    def assertSections(self):
+        title = uscode.title_for(self.filename)
+        sections = list(title.iter_sections())
+        self.assertTrue(sections)
+        for expected in sections:
+            section = uscode.load_section(2011, 26, expected.enum(), self.tmp)
+            self.assertEqual(section.enum(), expected.enum())
+            self.assertEqual(section.as_tree().json(),
+                             expected.as_tree().json())
+        self.assertRaises(KeyError, uscode.load_section, 2011, 26, '1',
+                          self.tmp)
+
+    def test_matches_whole_title(self):
+        self.assertSections()
+        # And again, from the sidecar saved the first time.
+        self.assertTrue(os.path.exists(self.filename + '.idx'))
+        self.assertSections()
+
+    def test_zip(self):
+        archive = self.filename[:-len('.11')] + '.zip'
+        with zipfile.ZipFile(archive, 'w') as f:
+            f.write(self.filename, 'usc26.11')
+        expected = uscode.title_for(self.filename)
+        os.remove(self.filename)
+        for section in expected.iter_sections():
+            loaded = uscode.load_section(2011, 26, section.enum(), self.tmp)
+            self.assertEqual(loaded.as_tree().json(),
+                             section.as_tree().json())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,145 @@
-from .parser import getlines
-from .grouper import group
+import os
+import re
+import zipfile
+
+from .parser import getlines, getspans, GPOLocatorLine
+from .grouper import group, igroup
 from .models import *
+from .index import indexed_lines, load_index
+from . import snapshot, corpus
+from .edition import (iter_edition, load_edition, cache_edition,
+                      write_edition, TitleResult, WriteResult)
+
+
+# Where download/gpolocator.sh puts the gpo locator files.
+INPUT_DIR = 'data/uscode.house.gov/zip'
+
+
+def open_title(filename):
+    '''Open the gpo locator file `filename` for reading. If it's a zip
+    archive as downloaded from uscode.house.gov (usc08.zip), the title
+    inside it is decompressed as it's read instead of being extracted.
+    '''
+    if not filename.endswith('.zip'):
+        return open(filename, 'rb')
+    archive = zipfile.ZipFile(filename)
+    members = [info for info in archive.infolist()
+               if not info.filename.endswith('/')]
+    if not members:
+        raise ValueError('No gpo locator file in %r' % filename)
+    return archive.open(members[0])
+
+
+def lines_for(filename):
+    '''Return an iterator of the GPOLocatorLines in `filename`. Plain
+    files are read through their sidecar index; zip archives are
+    streamed.
+    '''
+    if filename.endswith('.zip'):
+        return getlines(open_title(filename))
+    return indexed_lines(filename)
+
 
 def title_for(filename):
-    return File(open(filename))
+    '''Load the title in `filename`, which may be an extracted gpo
+    locator file or the zip archive it came in.
+    '''
+    return File(lines=lines_for(filename))
+
+
+def cached_title_for(filename, cache_dir=snapshot.CACHE_DIR):
+    '''Like `title_for`, but the title's grouped documents and section
+    trees come from its snapshot (see uscode.snapshot), which is made
+    the first time the title is loaded. The trees are shared: each
+    section's `as_tree` returns the same one every time.
+    '''
+    lines, documents, trees = snapshot.load_snapshot(filename, cache_dir)
+    return File(lines=lines, documents=documents, trees=trees)
+
+
+def iter_title(filename):
+    '''Yield the model instance for each top-level document in the
+    title in `filename` as soon as it has been grouped, without holding
+    the whole title in memory.
+    '''
+    for doc in igroup(lines_for(filename)):
+        yield doc.instance
+
+
+def iter_sections(filename):
+    '''Like `iter_title`, but only yield sections.'''
+    for inst in iter_title(filename):
+        if isinstance(inst, Section):
+            yield inst
+
+
+def title_filename(title, year, input_dir=INPUT_DIR):
+    '''Return the path of a title's gpo locator file for `year`, or of
+    the zip archive it came in if it was never extracted.
+    '''
+    year = str(year)
+    dirname = os.path.join(input_dir, year)
+    filename = os.path.join(dirname, 'usc%02d.%02d' % (int(title), int(year[2:])))
+    if not os.path.exists(filename):
+        archive = os.path.join(dirname, 'usc%02d.zip' % int(title))
+        if os.path.exists(archive):
+            return archive
+    return filename
+
+
+def load_section(year, title, section, input_dir=INPUT_DIR):
+    '''Return the Section model for `section` (a section number string
+    like '101') of `title` in the `year` edition of the Code.
+
+    Only that section's bytes are read and tokenized: their range is
+    looked up in the title's sidecar index, which is built the first
+    time the title is used. Raises KeyError if there's no such section.
+    '''
+    filename = title_filename(title, year, input_dir)
+    if filename.endswith('.zip'):
+        # Archives can't be seeked into, so fall back to a scan.
+        for inst in iter_sections(filename):
+            if inst.enum() == section:
+                return inst
+        raise KeyError(section)
+
+    index = load_index(filename)
+    try:
+        start, end = index.section_range(section)
+    finally:
+        index.close()
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        buf = f.read(end - start)
+    lines = (GPOLocatorLine(code, arg, buf[datastart:eol])
+             for code, arg, datastart, eol in getspans(buf))
+    doc, = igroup(lines)
+    return doc.instance
+
+
+def title_filenames(path):
+    '''Return the sorted filenames of the titles in the year directory
+    `path`. Where a title is present both extracted and zipped, the
+    extracted file wins.
+    '''
+    found = {}
+    for name in os.listdir(path):
+        m = re.match(r'^(usc\d+a?)\.(\d\d|zip)$', name, re.I)
+        if m:
+            stem, ext = m.groups()
+            if ext.lower() == 'zip' and stem in found:
+                continue
+            found[stem] = os.path.join(path, name)
+    return [found[stem] for stem in sorted(found)]
+
+
+def titles_for(path):
+    '''Yield a File for each title in the year directory `path`, which
+    can hold zip archives, extracted files or both.
+    '''
+    for filename in title_filenames(path):
+        yield title_for(filename)
+
 
 class File(object):
 
@@ -17,16 +153,88 @@ class File(object):
         Subpart,
         ]
 
-    def __init__(self, fp):
-        '''Pass it an open gpo locator file.
+    def __init__(self, fp=None, mapped=False, lines=None, documents=None,
+                 trees=None):
+        '''Pass it an open gpo locator file. If `mapped` is true, the
+        file is memory-mapped and tokenized in place. Alternatively,
+        pass in an iterator of already tokenized `lines`, or the
+        `documents` already grouped from them along with a dict of the
+        parse `trees` of some of them by document number (as loaded
+        from a snapshot).
         '''
-        self._lines = lines = getlines(fp)
-        self._grouped = grouped = group(lines)
-        self.instances = [g.instance for g in grouped]
+        if lines is None:
+            lines = getlines(fp, mapped=mapped)
+        self._lines = lines
+        if documents is None:
+            documents = group(lines)
+        self._grouped = documents
+        self._trees = trees or {}
+
+        # Model instances are only built when they're asked for.
+        self._instances = {}
+        self._section_docs = None
+        self._section_index = None
         # self._build()
 
+    def __len__(self):
+        return len(self._grouped)
+
+    def __iter__(self):
+        '''Yield each document's model instance, in order.'''
+        for n in xrange(len(self._grouped)):
+            yield self.instance(n)
+
+    def instance(self, n):
+        '''Return the model instance of the `n`th document.'''
+        try:
+            return self._instances[n]
+        except KeyError:
+            inst = self._instances[n] = self._grouped[n].instance
+            tree = self._trees.get(n)
+            if tree is not None:
+                inst._tree = tree
+            return inst
+
+    @property
+    def instances(self):
+        return list(self)
+
+    def _index_sections(self):
+        '''Find the section documents and their numbers without
+        building any models.
+        '''
+        section_docs = []
+        section_index = {}
+        for n, doc in enumerate(self._grouped):
+            if doc.first_code != Section.applies_to:
+                continue
+            section_docs.append(n)
+            try:
+                enum = Section.parse_enum(doc.first_line)
+            except ValueError:
+                continue
+            section_index.setdefault(enum, n)
+        self._section_docs = section_docs
+        self._section_index = section_index
+
+    def section(self, enum):
+        '''Return the section numbered `enum` (a string like '101').
+        If the number is used twice, the first section wins. Raises
+        KeyError if there's no such section.
+        '''
+        if self._section_index is None:
+            self._index_sections()
+        return self.instance(self._section_index[enum])
+
+    def iter_sections(self):
+        '''Yield the title's sections in order.'''
+        if self._section_docs is None:
+            self._index_sections()
+        for n in self._section_docs:
+            yield self.instance(n)
+
     def sections(self):
-        return [inst for inst in self.instances if isinstance(inst, Section)]
+        return list(self.iter_sections())
 
     # def _build(self):
     #     '''Assembly the titles, chapters, headings, sections into a tree.
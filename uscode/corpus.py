@@ -0,0 +1,246 @@
+'''
+An edition of the Code in one memory-mapped file, shared by workers.
+
+When titles are parsed or served by several processes at once, each of
+them reading and tokenizing the same inputs means as many copies of the
+edition in memory as there are processes. Instead, one process writes
+the edition to a corpus file, holding for each title:
+
+  * the title's raw bytes
+  * its LineIndex (see uscode.index), in the same layout as a sidecar
+  * the (start, stop, subdocs, id) range of each top-level document
+
+and each worker maps it read-only with `attach`. A mapped file's pages
+live in the OS page cache and are shared between every process that
+maps it, so N workers cost about one copy of the edition. A title's
+lines aren't held in lists; each GPOLocatorLine is made from the index
+and the raw bytes when something asks for it.
+
+The file starts with a MAGIC line. Every block is aligned to 8 bytes,
+and after the last one comes a JSON header describing them, followed by
+the header's offset as an 8 byte integer.
+
+Usage:
+
+>>> build_corpus(edition_filenames(2011), 'data/cache/corpus/2011.corpus')
+>>> corpus = attach('data/cache/corpus/2011.corpus')
+>>> corpus.title('usc26.11').section('501').as_tree()
+'''
+import os
+import sys
+import json
+import struct
+import marshal
+
+import logbook
+
+from .grouper import Document, group
+from .index import (LineIndex, MappedLines, mapfile, unmap, load_index,
+                    file_hash, is_current)
+from .utils import mkdir_p, replacing
+
+
+logger = logbook.Logger('corpus')
+
+MAGIC = 'uscode-corpus'
+
+# Bump this whenever the layout of a corpus file changes.
+VERSION = 1
+
+# Where `./run corpus` puts an edition's corpus file.
+CORPUS_DIR = 'data/cache/corpus'
+
+_trailer = struct.Struct('=Q')
+
+# Corpus files mapped by this process, by path.
+_attached = {}
+
+
+class CorpusFormatError(Exception):
+    '''Raised when a corpus file can't be read with this version of the
+    code.
+    '''
+    pass
+
+
+def corpus_filename(year, corpus_dir=CORPUS_DIR):
+    return os.path.join(corpus_dir, '%s.corpus' % year)
+
+
+#-----------------------------------------------------------------------------
+# Writing.
+
+def _align(fp):
+    fp.write('\0' * (-fp.tell() % 8))
+
+
+def _write_title(fp, filename, chunksize=1 << 20):
+    '''Write the blocks of the title in `filename` to `fp`, returning
+    its entry in the header.
+    '''
+    # Imported here, since the package imports this module.
+    from . import open_title
+
+    if filename.endswith('.zip'):
+        buf = open_title(filename).read()
+        index = LineIndex.build(buf, name=filename)
+        sha1 = file_hash(filename)
+    else:
+        index = load_index(filename)
+        buf = mapfile(filename)
+        header = getattr(index, 'header', None)
+        sha1 = header['sha1'] if header else file_hash(filename)
+    try:
+        st = os.stat(filename)
+        entry = dict(name=os.path.basename(filename), filename=filename,
+                     size=st.st_size, mtime=int(st.st_mtime), sha1=sha1)
+
+        _align(fp)
+        entry['data'] = (fp.tell(), len(buf))
+        for start in xrange(0, len(buf), chunksize):
+            fp.write(buf[start:start + chunksize])
+
+        _align(fp)
+        entry['index'] = fp.tell()
+        index.dump(fp)
+
+        # The grouper only looks at each line's code and argument (and
+        # the text of I74 headings), so this is cheap next to tokenizing.
+        documents = group(index.lines(buf))
+        data = marshal.dumps(tuple(
+            (doc.start, doc.stop, tuple(doc.subdocs), doc.id)
+            for doc in documents))
+        _align(fp)
+        entry['documents'] = (fp.tell(), len(data))
+        fp.write(data)
+    finally:
+        unmap(buf)
+        index.close()
+    return entry
+
+
+def build_corpus(filenames, path):
+    '''Write the titles in `filenames` (extracted or zipped gpo locator
+    files) to a corpus file at `path`.
+    '''
+    dirname = os.path.dirname(path)
+    if dirname:
+        mkdir_p(dirname)
+    with replacing(path) as fp:
+        fp.write(('%s %d' % (MAGIC, VERSION)).ljust(15) + '\n')
+        titles = []
+        for filename in filenames:
+            logger.info('Adding %r to %r' % (filename, path))
+            titles.append(_write_title(fp, filename))
+        _align(fp)
+        offset = fp.tell()
+        header = dict(version=VERSION, byteorder=sys.byteorder,
+                      titles=titles)
+        fp.write(json.dumps(header, sort_keys=True))
+        fp.write(_trailer.pack(offset))
+
+
+#-----------------------------------------------------------------------------
+# Reading.
+
+def read_header(buf):
+    '''Return the JSON header of the corpus file mapped in `buf`.'''
+    if buf[:len(MAGIC)] != MAGIC or len(buf) < 16 + _trailer.size:
+        raise CorpusFormatError('Not a corpus file.')
+    version = buf[len(MAGIC):16].strip()
+    if version != str(VERSION):
+        raise CorpusFormatError('Corpus version %r is not %r.' % (
+            version, VERSION))
+    offset, = _trailer.unpack(buf[-_trailer.size:])
+    try:
+        header = json.loads(buf[offset:len(buf) - _trailer.size])
+    except ValueError as e:
+        raise CorpusFormatError('Malformed corpus header: %r' % e)
+    if header.get('byteorder') != sys.byteorder:
+        raise CorpusFormatError('Corpus was written on a machine with a '
+                                'different byte order.')
+    return header
+
+
+class Corpus(object):
+    '''A corpus file, mapped read-only. Titles are looked up by the name
+    of the file they came from (e.g. 'usc26.11').
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.buf = mapfile(path)
+        self.header = read_header(self.buf)
+        self.names = [entry['name'] for entry in self.header['titles']]
+        self._entries = dict((entry['name'], entry)
+                             for entry in self.header['titles'])
+        self._indexes = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def index(self, name):
+        '''Return the LineIndex of title `name`, over the mapped arrays.'''
+        try:
+            return self._indexes[name]
+        except KeyError:
+            index = LineIndex.load(self.buf, self._entries[name]['index'])
+            self._indexes[name] = index
+            return index
+
+    def lines(self, name):
+        '''Return a MappedLines sequence of the lines of title `name`.'''
+        offset, length = self._entries[name]['data']
+        # A buffer is a view; slicing it copies out just that slice.
+        return MappedLines(self.index(name), buffer(self.buf, offset, length))
+
+    def documents(self, name):
+        '''Return the top-level Documents of title `name`.'''
+        offset, length = self._entries[name]['documents']
+        ranges = marshal.loads(self.buf[offset:offset + length])
+        lines = self.lines(name)
+        return [Document(lines, start, stop, subdocs, id)
+                for start, stop, subdocs, id in ranges]
+
+    def title(self, name):
+        '''Return a File of title `name` whose lines and documents are
+        views of the corpus.
+        '''
+        from . import File
+
+        return File(lines=self.lines(name), documents=self.documents(name))
+
+    def sha1(self, name):
+        return self._entries[name]['sha1']
+
+    def stale(self):
+        '''Return the names of the titles whose files have changed (or
+        gone) since the corpus was written.
+        '''
+        res = []
+        for name in self.names:
+            entry = self._entries[name]
+            try:
+                current = is_current(entry, entry['filename'])
+            except OSError:
+                current = False
+            if not current:
+                res.append(name)
+        return res
+
+
+def attach(path):
+    '''Return the Corpus at `path`, mapping it the first time this
+    process asks for it. Pass it to a worker pool's initializer so each
+    worker maps the file once.
+    '''
+    try:
+        return _attached[path]
+    except KeyError:
+        corpus = _attached[path] = Corpus(path)
+        return corpus
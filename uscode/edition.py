@@ -0,0 +1,231 @@
+'''
+Loading a whole edition of the Code (every title of one year) at once.
+
+Titles are tokenized, grouped and parsed in a pool of worker processes,
+one title per task, and nothing bigger than a traceback is pickled back
+to the parent:
+
+  * write_edition has each worker write its title's sections out as
+    json and send back only how many it wrote, so the whole job scales
+    with the number of processes.
+  * cache_edition has each worker save its title's snapshot (see
+    uscode.snapshot), for cached_title_for to load quickly later on.
+  * iter_edition yields each title's File to the parent. Workers hand
+    back snapshot data, which the parent decodes one title at a time,
+    so only the parsing gets faster with more processes.
+
+Usage:
+
+>>> for result in write_edition(2011, 'data/output/2011', processes=8):
+...     if result.error is None:
+...         print result.filename, result.count
+'''
+import os
+import re
+import traceback
+import multiprocessing
+from itertools import imap
+from collections import namedtuple
+
+import logbook
+
+from . import snapshot
+from .utils import mkdir_p
+
+
+logger = logbook.Logger('edition')
+
+
+# What's yielded for each title: `title` is its File, or None if it
+# failed, in which case `error` is the traceback from the worker.
+TitleResult = namedtuple('TitleResult', 'filename title error')
+
+# What write_edition yields for each title: `count` is the number of
+# sections written, or None if it failed.
+WriteResult = namedtuple('WriteResult', 'filename count error')
+
+
+def title_number(filename):
+    '''Return the title number of the gpo locator file or zip archive
+    `filename`, as a string: 'usc05a.11' -> '5a'.
+    '''
+    return re.match(r'usc0*(\d+a?)', os.path.basename(filename),
+                    re.I).group(1)
+
+
+def load_title_data(args):
+    '''Run in a worker: return (filename, snapshot data, None) for the
+    title in `filename`, or (filename, None, traceback) if it couldn't
+    be loaded. Never raises, so one bad title can't take down the pool.
+    '''
+    filename, cache_dir = args
+    try:
+        data = snapshot.snapshot_data(filename, cache_dir)
+    except Exception:
+        return filename, None, traceback.format_exc()
+    return filename, data, None
+
+
+def cache_title(args):
+    '''Run in a worker: make sure the title in `filename` has a snapshot,
+    returning (filename, None), or (filename, traceback) if it couldn't
+    be made. Nothing else is sent back to the parent.
+    '''
+    filename, cache_dir = args
+    try:
+        snapshot.make_snapshot(filename, cache_dir)
+    except Exception:
+        return filename, traceback.format_exc()
+    return filename, None
+
+
+def write_sections(sections, output_dir, indent=2):
+    '''Write each of `sections` to `output_dir` as <section number>.json,
+    returning how many were written. Each tree is written out as it's
+    walked, rather than building the whole json document in memory.
+    '''
+    mkdir_p(output_dir)
+    count = 0
+    for section in sections:
+        path = os.path.join(output_dir, '%s.json' % section.enum())
+        with open(path, 'w') as f:
+            section.as_tree().write_json(f, indent=indent)
+        count += 1
+    return count
+
+
+def write_title(args):
+    '''Run in a worker: write the sections of the title in `filename` to
+    <output_dir>/<title number>/ as json, returning (filename, number of
+    sections, None), or (filename, None, traceback) if it failed. With
+    `cache`, the sections come from the title's snapshot; otherwise
+    they're streamed, one at a time.
+    '''
+    # Imported here, since the package imports this module.
+    from . import cached_title_for, iter_sections
+
+    filename, cache_dir, output_dir, indent, cache = args
+    try:
+        if cache:
+            sections = cached_title_for(filename, cache_dir).iter_sections()
+        else:
+            sections = iter_sections(filename)
+        count = write_sections(
+            sections, os.path.join(output_dir, title_number(filename)),
+            indent)
+    except Exception:
+        return filename, None, traceback.format_exc()
+    return filename, count, None
+
+
+def edition_filenames(year, input_dir=None):
+    '''Return the sorted filenames of the titles in the `year` edition.'''
+    # Imported here, since the package imports this module.
+    from . import INPUT_DIR, title_filenames
+
+    if input_dir is None:
+        input_dir = INPUT_DIR
+    return title_filenames(os.path.join(input_dir, str(year)))
+
+
+def map_titles(filenames, processes=None, cache_dir=snapshot.CACHE_DIR,
+               worker=load_title_data, extra=()):
+    '''Yield the result of `worker` (by default `load_title_data`) for
+    each of `filenames`, in order, running them across `processes` worker
+    processes (by default, one per CPU). Each task is the tuple
+    (filename, cache_dir) + `extra`. With `processes=1`, everything is
+    done in this process.
+    '''
+    tasks = [(filename, cache_dir) + tuple(extra) for filename in filenames]
+    if processes == 1 or len(tasks) < 2:
+        for res in imap(worker, tasks):
+            yield res
+        return
+
+    pool = multiprocessing.Pool(processes)
+    finished = False
+    try:
+        # imap hands results back in the order of the tasks, whichever
+        # worker finishes first.
+        for res in pool.imap(worker, tasks, chunksize=1):
+            yield res
+        finished = True
+    finally:
+        # If the caller stopped early, don't wait for the rest.
+        if finished:
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()
+
+
+def iter_edition(year, processes=None, input_dir=None,
+                 cache_dir=snapshot.CACHE_DIR):
+    '''Yield a TitleResult for each title of the `year` edition, in title
+    order, parsing them across `processes` worker processes. Each title's
+    snapshot is decoded here, serially, as it's yielded, so only the
+    parsing gets faster with more processes. A title that fails is
+    logged and yielded with its error instead of a File; the rest are
+    unaffected.
+    '''
+    from . import File
+
+    filenames = edition_filenames(year, input_dir)
+    for filename, data, error in map_titles(filenames, processes, cache_dir):
+        if error is None:
+            try:
+                lines, documents, trees = snapshot.decode(data)
+            except snapshot.SnapshotFormatError:
+                error = traceback.format_exc()
+        if error is not None:
+            log_failure(filename, error)
+            yield TitleResult(filename, None, error)
+            continue
+        title = File(lines=lines, documents=documents, trees=trees)
+        yield TitleResult(filename, title, None)
+
+
+def load_edition(year, processes=None, input_dir=None,
+                 cache_dir=snapshot.CACHE_DIR):
+    '''Return a list of the TitleResults of `iter_edition`.'''
+    return list(iter_edition(year, processes, input_dir, cache_dir))
+
+
+def cache_edition(year, processes=None, input_dir=None,
+                  cache_dir=snapshot.CACHE_DIR):
+    '''Make sure every title of the `year` edition has a snapshot, in
+    parallel, without loading any of them here. Afterwards
+    `cached_title_for` loads each one quickly. Returns (filename,
+    traceback) for each title that failed.
+    '''
+    failed = []
+    filenames = edition_filenames(year, input_dir)
+    for filename, error in map_titles(filenames, processes, cache_dir,
+                                      cache_title):
+        if error is not None:
+            log_failure(filename, error)
+            failed.append((filename, error))
+    return failed
+
+
+def write_edition(year, output_dir, processes=None, indent=2,
+                  input_dir=None, cache_dir=snapshot.CACHE_DIR, cache=False):
+    '''Write the sections of every title of the `year` edition to
+    <output_dir>/<title number>/<section number>.json, a title per task
+    across `processes` worker processes, yielding a WriteResult for each
+    title in title order as it's done. With `cache`, titles are loaded
+    from (and make) their snapshots. A title that fails is logged and
+    yielded with its error; the rest are unaffected.
+    '''
+    filenames = edition_filenames(year, input_dir)
+    results = map_titles(filenames, processes, cache_dir, write_title,
+                         (output_dir, indent, cache))
+    for filename, count, error in results:
+        if error is not None:
+            log_failure(filename, error)
+        yield WriteResult(filename, count, error)
+
+
+def log_failure(filename, error):
+    logger.critical('Failed to load %r: %s' % (
+        filename, error.strip().splitlines()[-1]))
@@ -71,21 +71,107 @@ Statute Body
  Q04 - dedent
 '''
 from collections import defaultdict
-from operator import itemgetter
 
 from .utils import NiceList
 from .models import getclass
 
 
-class Document(dict):
-    lines = property(itemgetter('lines'))
-    codemap = property(itemgetter('codemap'))
-    docs = property(itemgetter('docs'))
-    id = property(itemgetter('id'))
+class Document(object):
+    '''A top-level document or a subdocument. Rather than holding its
+    own lists, a document is a range of line numbers into a list of
+    lines shared with the documents around it:
+
+      * lines[start:stop] are the document's lines, including those of
+        its subdocuments;
+      * `subdocs` is a sequence of (id, start) pairs, one for each
+        subdocument, which runs up to the start of the next one (or
+        `stop`). The document's own lines end where the first
+        subdocument starts.
+
+    The `lines`, `codemap` and `docs` views are built from the ranges
+    the first time they're asked for. Item access (doc['codemap']) also
+    works.
+    '''
+    __slots__ = ('_lines', 'start', 'stop', 'subdocs', 'id',
+                 '_own_lines', '_codemap', '_docs')
+
+    def __init__(self, lines, start, stop, subdocs=(), id=None):
+        self._lines = lines
+        self.start = start
+        self.stop = stop
+        self.subdocs = subdocs
+        self.id = id
+        self._own_lines = None
+        self._codemap = None
+        self._docs = None
+
+    def __getitem__(self, key):
+        if key in ('lines', 'codemap', 'docs', 'id'):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __repr__(self):
+        return '<Document %r lines %d-%d>' % (self.id, self.start, self.stop)
+
+    @property
+    def head(self):
+        '''The end of the document's own lines.'''
+        if self.subdocs:
+            return self.subdocs[0][1]
+        return self.stop
+
+    @property
+    def lines(self):
+        lines = self._own_lines
+        if lines is None:
+            lines = self._own_lines = NiceList(
+                self._lines[self.start:self.head])
+        return lines
+
+    @property
+    def codemap(self):
+        '''Mapping of codearg tuples to the lines with those codeargs,
+        indexed on first access.
+        '''
+        codemap = self._codemap
+        if codemap is None:
+            codemap = defaultdict(NiceList)
+            lines = self.lines
+            if self.id is not None and lines:
+                # A document that began at a boundary maps the
+                # boundary's codearg to all of its lines.
+                first = lines[0][:2]
+                codemap[first] = lines
+                for line in lines.rest:
+                    codearg = line[:2]
+                    if codearg != first:
+                        codemap[codearg].append(line)
+            else:
+                for line in lines:
+                    codemap[line[:2]].append(line)
+            codemap = self._codemap = dict(codemap)
+        return codemap
+
+    @property
+    def docs(self):
+        '''Mapping of subdocument ids to lists of subdocuments.'''
+        docs = self._docs
+        if docs is None:
+            docs = self._docs = defaultdict(NiceList)
+            subdocs = self.subdocs
+            stops = [start for _, start in subdocs[1:]] + [self.stop]
+            for (subdoc_id, start), stop in zip(subdocs, stops):
+                subdoc = Document(self._lines, start, stop, id=subdoc_id)
+                docs[subdoc_id].append(subdoc)
+        return docs
+
+    @property
+    def first_line(self):
+        return self._lines[self.start]
 
     @property
     def first_code(self):
-        return self.lines.first.as_tuple()
+        return self._lines[self.start][:2]
 
     @property
     def instance(self):
@@ -108,86 +194,65 @@ boundaries = {
 
 
 def group(iterator, boundaries=boundaries):
+    '''Return a list of all the documents grouped from `iterator`,
+    sharing a single list of lines. See `igroup`.
+    '''
+    return list(igroup(iterator, boundaries, lines=[]))
+
+
+def igroup(iterator, boundaries=boundaries, lines=None):
     '''
     Regroup the GPOLocator lines into chunks relating to title,
     chapters, and sections, each with internal sections grouped into
     'sub documents', for lack of a more imaginitive name. Each document
-    contains a list of lines and mapping of code-argument tuples to
-    lines with those codeargs.
+    is a range of lines, with a lazily built mapping of code-argument
+    tuples to lines with those codeargs.
 
-    This code is lengthy and convoluted in order to achieve the
-    regrouping in a single pass.
+    Each top-level document is yielded as soon as the boundary of the
+    next one is seen. If `lines` is given, every document's lines are
+    appended to it; otherwise each document gets a list of its own, so
+    only one document's lines are held at a time.
     '''
-
     I74 = ('I', '74')
-    res = []
-
-    lines = NiceList()
-    subdoc = None
-    subdoc_id = None
-    subdocs = defaultdict(NiceList)
-    codemap = defaultdict(NiceList)
-    doc = Document({'lines': lines, 'docs': subdocs,
-                    'codemap': codemap})
-    in_subdoc = False
-    sub_boundaries = [I74]
 
-    while True:
+    shared = lines is not None
+    if not shared:
+        lines = []
+    start = len(lines)
+    subdocs = []
+    doc_id = None
+    sub_boundaries = [I74]
 
-        try:
-            line = next(iterator)
-        except StopIteration:
-            break
+    for line in iterator:
 
-        code, arg = codearg = line[:2]
+        codearg = line[:2]
 
         if codearg in boundaries:
             sub_boundaries = boundaries[codearg] + [I74]
 
-        #starting_complex_table = (code == 'c')
-
-        if codearg in sub_boundaries:  # or starting_complex_table:
+        if codearg in sub_boundaries:
 
-            # If already in a subdoc, append it
-            if in_subdoc:
-                subdoc['codemap'] = dict(subdoc['codemap'])
-                subdocs[subdoc_id].append(subdoc)
-
-            # Start a new subdoc
-            subdoc_lines = NiceList([line])
-            subdoc_codemap = defaultdict(NiceList, {codearg: subdoc_lines})
+            # Start a new subdoc.
             if codearg == I74:
                 subdoc_id = line.data.strip()
             else:
                 subdoc_id = codearg
-            subdoc = Document({'lines': subdoc_lines,
-                               'codemap': subdoc_codemap})
-            in_subdoc = True
+            subdocs.append((subdoc_id, len(lines)))
 
         elif codearg in boundaries:
 
-            if in_subdoc:
-                subdoc['codemap'] = dict(subdoc['codemap'])
-                subdocs[subdoc_id].append(subdoc)
-
-            # append the current doc
-            doc['codemap'] = dict(doc['codemap'])
-            res.append(doc)
-
-            # start a new one
-            lines = NiceList([line])
-            codemap = defaultdict(NiceList, {codearg: lines})
-            subdocs = defaultdict(NiceList)
-            doc = Document({'lines': lines, 'docs': subdocs,
-                            'codemap': codemap, 'id': codearg})
-            in_subdoc = False
-
-        else:
-            if in_subdoc:
-                subdoc_lines.append(line)
-                subdoc_codemap[codearg].append(line)
-            else:
-                lines.append(line)
-                codemap[codearg].append(line)
-
-    return res
+            # Yield the current doc (unless the input began with this
+            # boundary) and start a new one.
+            if start < len(lines):
+                yield Document(lines, start, len(lines), subdocs, doc_id)
+            if not shared:
+                lines = []
+            start = len(lines)
+            subdocs = []
+            doc_id = codearg
+
+        lines.append(line)
+
+    # Don't drop the last document at the end of the input.
+    if start < len(lines):
+        yield Document(lines, start, len(lines), subdocs, doc_id)
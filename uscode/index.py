@@ -0,0 +1,456 @@
+'''
+A columnar index of the lines in a gpo locator file.
+
+Tokenizing a big title (26, 42) means scanning hundreds of MB, so the
+result is saved in a sidecar file next to the input (usc42.11 ->
+usc42.11.idx) and reused as long as the input hasn't changed. The index
+holds, for each line the tokenizer recognized:
+
+  * codes   - the code's id (its position in `code_names`)
+  * offsets - the byte offset of the start of the line
+  * datas   - the byte offset where the line's data begins
+  * ends    - the byte offset of the end of the line
+
+so the argument is buf[offsets[i] + 1 + len(code):datas[i]] and the
+data is buf[datas[i]:ends[i]]. It also holds `groups`, the number of
+the first line of each top-level document (see grouper.boundaries), and
+`sections`, the number and byte range of each section (I80) document.
+
+Usage:
+
+>>> lines = indexed_lines('usc08.11')
+>>> next(lines)
+GPOLocatorLine(code='F', arg='5800', data=u'\\r\\n')
+
+The sidecar starts with a one-line JSON header recording the input's
+size, mtime and sha1 along with the layout of the arrays that follow
+it. Loading it maps the file and reads the arrays in place.
+'''
+import os
+import sys
+import json
+import mmap
+import struct
+import hashlib
+from array import array
+
+import logbook
+
+from .parser import (codes, getspans, report_unrecognized,
+                     GPOLocatorLine, GPOLocatorSpan)
+from .grouper import boundaries
+from .models import Section
+from .utils import replacing
+
+
+logger = logbook.Logger('index')
+
+# Bump this whenever the layout of the sidecar changes.
+VERSION = 3
+
+# Code ids are positions in this list.
+code_names = sorted(codes)
+code_ids = dict((code, i) for i, code in enumerate(code_names))
+
+# Typecode for the byte offset arrays; needs at least 4 bytes.
+_offset_typecode = 'I' if array('I').itemsize >= 4 else 'L'
+
+_fields = (
+    ('codes', 'B'),
+    ('offsets', _offset_typecode),
+    ('datas', _offset_typecode),
+    ('ends', _offset_typecode),
+    ('groups', _offset_typecode),
+    )
+
+
+class IndexFormatError(Exception):
+    '''Raised when a sidecar can't be read with this version of the code.
+    '''
+    pass
+
+
+class MappedArray(object):
+    '''Read-only view of an array stored in a buffer (usually an mmap).
+    Items are unpacked on access; slicing copies just that range out
+    into a real array.
+    '''
+    def __init__(self, buf, offset, typecode, length):
+        self.buf = buf
+        self.offset = offset
+        self.typecode = typecode
+        self.itemsize = struct.calcsize('=' + typecode)
+        self.length = length
+        self._struct = struct.Struct('=' + typecode)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            itemsize = self.itemsize
+            start = self.offset + start * itemsize
+            stop = self.offset + max(stop * itemsize, 0)
+            res = array(self.typecode)
+            if start < stop:
+                res.fromstring(self.buf[start:stop])
+            return res[::step]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('MappedArray index out of range')
+        offset = self.offset + index * self.itemsize
+        return self._struct.unpack_from(self.buf, offset)[0]
+
+    def __iter__(self):
+        # Copy out a chunk at a time rather than unpacking item by item.
+        chunk = 1 << 16
+        for start in xrange(0, self.length, chunk):
+            for item in self[start:start + chunk]:
+                yield item
+
+
+class MappedLines(object):
+    '''Read-only sequence of the GPOLocatorLines of a title, made from
+    its index and buffer as they're asked for rather than held in a
+    list. Slicing returns a list of just those lines.
+    '''
+    def __init__(self, index, buf):
+        self.index = index
+        self.buf = buf
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in xrange(start, stop, step)]
+            if start >= stop:
+                return []
+            return list(self.index.lines(self.buf, start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('MappedLines index out of range')
+        return next(self.index.lines(self.buf, index, index + 1))
+
+    def __iter__(self):
+        return self.index.lines(self.buf)
+
+
+class LineIndex(object):
+
+    def __init__(self, codes, offsets, datas, ends, groups, sections=(),
+                 unrecognized=None):
+        self.codes = codes
+        self.offsets = offsets
+        self.datas = datas
+        self.ends = ends
+        self.groups = groups
+        self.sections = sections
+        self.unrecognized = unrecognized or {}
+        self._section_ranges = None
+        # The buffer a loaded index reads its arrays from.
+        self.buf = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def build(cls, buf, name=None):
+        '''Tokenize `buf` and index every line.'''
+        codes = array('B')
+        offsets = array(_offset_typecode)
+        datas = array(_offset_typecode)
+        ends = array(_offset_typecode)
+        groups = array(_offset_typecode, [0])
+        unrecognized = {}
+        for lineno, span in enumerate(getspans(buf, unrecognized=unrecognized)):
+            code, arg, start, end = span
+            if arg is None:
+                # The code is left in the data.
+                offset = start - 1
+            else:
+                offset = start - len(arg) - len(code) - 1
+            codes.append(code_ids[code])
+            offsets.append(offset)
+            datas.append(start)
+            ends.append(end)
+            if lineno and (code, arg) in boundaries:
+                groups.append(lineno)
+        report_unrecognized(unrecognized, name)
+        index = cls(codes, offsets, datas, ends, groups,
+                    unrecognized=unrecognized)
+        index.sections = index._find_sections(buf)
+        return index
+
+    def _find_sections(self, buf, I80=code_ids['I']):
+        '''Return a list of (number, start, end) triples giving the byte
+        range of each section document.
+        '''
+        sections = []
+        for n in xrange(len(self.groups)):
+            start, stop = self.group_range(n)
+            if start == stop or self.codes[start] != I80:
+                continue
+            span = next(self.spans(buf, start, start + 1))
+            if span.arg != '80':
+                continue
+            line = GPOLocatorLine(span.code, span.arg,
+                                  buf[span.start:span.end])
+            try:
+                number = Section.parse_enum(line)
+            except ValueError:
+                logger.warning('Unnumbered section at byte %d' % span.start)
+                continue
+            sections.append(
+                (number,) + self.byte_range(start, stop))
+        return sections
+
+    def section_range(self, number):
+        '''Return the (start, end) byte range of section `number`. If
+        the number is used twice, the first section wins.
+        '''
+        ranges = self._section_ranges
+        if ranges is None:
+            ranges = {}
+            for enum, start, end in reversed(self.sections):
+                ranges[enum] = (start, end)
+            self._section_ranges = ranges
+        return ranges[number]
+
+    def spans(self, buf, start=0, stop=None, code_names=code_names,
+              GPOLocatorSpan=GPOLocatorSpan):
+        '''Yield a GPOLocatorSpan for each of lines `start` to `stop`.'''
+        if stop is None:
+            stop = len(self)
+        codes = self.codes[start:stop]
+        offsets = self.offsets[start:stop]
+        datas = self.datas[start:stop]
+        ends = self.ends[start:stop]
+        for code_id, offset, data, end in zip(codes, offsets, datas, ends):
+            code = code_names[code_id]
+            argstart = offset + 1 + len(code)
+            arg = buf[argstart:data] if argstart < data else None
+            yield GPOLocatorSpan(code, arg, data, end)
+
+    def lines(self, buf, start=0, stop=None, code_names=code_names,
+              GPOLocatorLine=GPOLocatorLine):
+        '''Yield a GPOLocatorLine for each of lines `start` to `stop`. Like
+        `spans`, but without making a span for every line on the way.
+        Each line gets a copy of its data rather than a view of `buf`
+        (see GPOLocatorLine).
+        '''
+        if stop is None:
+            stop = len(self)
+        codes = self.codes[start:stop]
+        offsets = self.offsets[start:stop]
+        datas = self.datas[start:stop]
+        ends = self.ends[start:stop]
+        for code_id, offset, data, end in zip(codes, offsets, datas, ends):
+            code = code_names[code_id]
+            argstart = offset + 1 + len(code)
+            arg = buf[argstart:data] if argstart < data else None
+            yield GPOLocatorLine(code, arg, buf[data:end])
+
+    def group_range(self, n):
+        '''Return the (start, stop) line numbers of top-level document `n`.
+        '''
+        groups = self.groups
+        start = groups[n]
+        if n + 1 < len(groups):
+            stop = groups[n + 1]
+        else:
+            stop = len(self)
+        return start, stop
+
+    def byte_range(self, start, stop):
+        '''Return the (start, end) byte offsets spanned by lines `start`
+        to `stop`.
+        '''
+        return self.offsets[start], self.ends[stop - 1]
+
+    def dump(self, fp, **header):
+        '''Write the index to `fp`, preceded by a JSON header holding
+        `header` and the layout of the arrays.
+        '''
+        arrays = [array(typecode, getattr(self, name))
+                  for name, typecode in _fields]
+        layout = []
+        header = dict(header, version=VERSION, byteorder=sys.byteorder,
+                      unrecognized=self.unrecognized, layout=layout,
+                      sections=self.sections)
+
+        # Offsets in the layout are relative to the end of the header,
+        # which is padded to a multiple of 8 bytes like each array, so
+        # that the arrays stay aligned.
+        offset = 0
+        for (name, typecode), arr in zip(_fields, arrays):
+            layout.append((name, typecode, offset, len(arr)))
+            offset += len(arr) * arr.itemsize
+            offset += -offset % 8
+        head = json.dumps(header, sort_keys=True, encoding='latin-1')
+        width = len(head) + 1
+        width += -width % 8
+        fp.write(head.ljust(width - 1) + '\n')
+
+        for arr in arrays:
+            arr.tofile(fp)
+            fp.write('\0' * (-(len(arr) * arr.itemsize) % 8))
+
+    @staticmethod
+    def read_header(buf, offset=0):
+        '''Return the JSON header of an index serialized at `offset` in
+        `buf` and the offset at which its arrays begin.
+        '''
+        end = buf.find('\n', offset)
+        if end == -1:
+            raise IndexFormatError('Malformed index header.')
+        header = json.loads(buf[offset:end])
+        if header.get('version') != VERSION:
+            raise IndexFormatError('Index version %r is not %r.' % (
+                header.get('version'), VERSION))
+        if header.get('byteorder') != sys.byteorder:
+            raise IndexFormatError('Index was written on a machine with a '
+                             'different byte order.')
+        return header, end + 1
+
+    @classmethod
+    def load(cls, buf, offset=0):
+        '''Load an index serialized with `dump` from `buf` (usually an
+        mmap), starting at `offset`, without copying its arrays.
+        '''
+        header, base = cls.read_header(buf, offset)
+        arrays = {}
+        for name, typecode, offset, length in header['layout']:
+            arrays[name] = MappedArray(buf, base + offset, typecode, length)
+        index = cls(sections=[tuple(s) for s in header['sections']],
+                    unrecognized=header['unrecognized'], **arrays)
+        index.header = header
+        index.buf = buf
+        return index
+
+    def close(self):
+        '''Unmap the sidecar a loaded index reads from. Don't close an
+        index that's part of a bigger mapping (see uscode.corpus).
+        '''
+        unmap(self.buf)
+        self.buf = None
+
+
+#-----------------------------------------------------------------------------
+# Sidecar files.
+
+def sidecar_filename(filename):
+    return filename + '.idx'
+
+
+def file_hash(filename, chunksize=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        while True:
+            chunk = f.read(chunksize)
+            if not chunk:
+                break
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def mapfile(filename):
+    '''Return a read-only mmap of `filename` (or its contents, if it's
+    empty and can't be mapped).
+    '''
+    with open(filename, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return f.read()
+
+
+def unmap(buf):
+    '''Close `buf` if it's a map made by `mapfile`.'''
+    if isinstance(buf, mmap.mmap):
+        buf.close()
+
+
+def is_current(header, filename):
+    '''Is the index described by `header` current for `filename`? If the
+    size matches, the contents are hashed and compared with the header's
+    sha1: a file rewritten in place within the same second keeps its
+    size and whole-second mtime. Only a header without a sha1 falls back
+    to the mtime.
+    '''
+    st = os.stat(filename)
+    if header.get('size') != st.st_size:
+        return False
+    sha1 = header.get('sha1')
+    if sha1 is not None:
+        return sha1 == file_hash(filename)
+    return header.get('mtime') == int(st.st_mtime)
+
+
+def load_index(filename, build=True):
+    '''Return the LineIndex for `filename`, mapped from its sidecar if
+    the sidecar is current. Otherwise build it and try to save a new
+    sidecar (or return None if `build` is false).
+    '''
+    sidecar = sidecar_filename(filename)
+    if os.path.exists(sidecar):
+        buf = mapfile(sidecar)
+        try:
+            index = LineIndex.load(buf)
+        except (IndexFormatError, ValueError, KeyError, TypeError) as e:
+            logger.info('Ignoring unreadable index %r: %r' % (sidecar, e))
+            unmap(buf)
+        else:
+            if is_current(index.header, filename):
+                return index
+            logger.info('Index %r is stale.' % sidecar)
+            index.close()
+
+    if not build:
+        return
+
+    logger.info('Indexing %r' % filename)
+    buf = mapfile(filename)
+    try:
+        index = LineIndex.build(buf, name=filename)
+    finally:
+        unmap(buf)
+    save_index(index, filename)
+    return index
+
+
+def save_index(index, filename):
+    '''Write `index` to the sidecar for `filename`. Failure to write it
+    (say, a read-only data directory) is logged, not raised.
+    '''
+    sidecar = sidecar_filename(filename)
+    st = os.stat(filename)
+    header = dict(size=st.st_size, mtime=int(st.st_mtime),
+                  sha1=file_hash(filename))
+    try:
+        with replacing(sidecar) as f:
+            index.dump(f, **header)
+    except EnvironmentError as e:
+        logger.warning('Couldn\'t write index %r: %r' % (sidecar, e))
+
+
+def indexed_lines(filename, start=0, stop=None):
+    '''Yield the GPOLocatorLines of `filename` (lines `start` to `stop`),
+    using its sidecar index instead of tokenizing it. The file and its
+    sidecar are unmapped once the lines have all been made.
+    '''
+    index = load_index(filename)
+    try:
+        buf = mapfile(filename)
+        try:
+            for line in index.lines(buf, start, stop):
+                yield line
+        finally:
+            unmap(buf)
+    finally:
+        index.close()
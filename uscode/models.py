@@ -5,6 +5,7 @@ from collections import namedtuple
 from .utils import CachedAttribute
 from .schemes import Enum
 from .structure import GPOLocatorParser
+from .parser import find_footnote_refs, parse_note
 
 
 class DataQualityError(Exception):
@@ -19,8 +20,25 @@ class Registry(type):
         cls = type.__new__(meta, name, bases, attrs)
         if 'applies_to' in attrs:
             meta._classes[attrs['applies_to']] = cls
+        cls._json_fields = meta.json_fields(cls)
         return cls
 
+    @staticmethod
+    def json_fields(cls):
+        '''Return a tuple of (name, function, converters) triples, one for
+        each method of `cls` (including inherited ones) marked with
+        @jsonval, ordered by name. Computed once per class so json()
+        doesn't have to search the instance's attributes.
+        '''
+        fields = []
+        for name in dir(cls):
+            attr = getattr(cls, name, None)
+            if getattr(attr, 'jsonval', False):
+                func = getattr(attr, 'im_func', attr)
+                converters = tuple(filter(callable, attr.jsonval_funcs))
+                fields.append((name, func, converters))
+        return tuple(fields)
+
 
 getclass = Registry._classes.get
 
@@ -36,6 +54,13 @@ def _subdoc_generator(key1, key2=('I', '21')):
     return func
 
 
+def json_many(instances):
+    '''Return a list of the json dicts of `instances`, such as all the
+    models in a title.
+    '''
+    return [inst.json() for inst in instances]
+
+
 def jsonval(*funcs):
     '''Decorator to mark functions for
     inclusion in json conversion. *funcs is a
@@ -58,6 +83,9 @@ class Base(object):
     class meta:
         abstract = True
 
+    # A parse tree loaded from a snapshot, if any.
+    _tree = None
+
     def __init__(self, data):
         self.sub = []
         self.data = data
@@ -67,39 +95,33 @@ class Base(object):
         return self.data['codemap']
 
     def json(self):
+        '''Return a dict of this model's @jsonval fields, using the
+        class's precomputed list of them.
+        '''
         res = {}
-        for attr in dir(self):
-            method = getattr(self, attr)
-            if hasattr(method, 'jsonval') and method.jsonval:
-                value = method()
-                for func in filter(callable, method.jsonval_funcs):
-                    value = func(value)
-                res[attr] = value
+        for name, func, converters in self._json_fields:
+            value = func(self)
+            for convert in converters:
+                value = convert(value)
+            res[name] = value
         return res
 
     def extract_footnote_refs(self, text):
         '''If any footnotes[^2] are in `text`, return
         a sequence of number, offset pairs.
         '''
-        for matchobj in re.finditer(r'\\(\d+)\\\x07N', text):
-            offset = matchobj.start()
-            number = matchobj.group(1)
-            yield number, offset
+        return iter(find_footnote_refs(text))
 
     def parse_footenote_content(self, text):
         '''Given text constituting a footnote ("[^2] So in original.")
         return the footnote number and the text.
         '''
-        matchobj = re.match(r'^\x07N\\(\d+)\\\s+', text)
-        if matchobj:
-            number = matchobj.group(1)
-            text = text.replace(matchobj.group(), '', 1)
-            return number, text
+        return parse_note(text)
 
     def get_notes(self):
         notes = self.data['docs'][('I', '93')][0]['codemap'][('I', '28')]
         for line in notes:
-            yield self.parse_footenote_content(line.data)
+            yield line.note
 
 
 class Title(Base):
@@ -225,10 +247,15 @@ class Subpart(Base):
 class Section(Base):
     applies_to = ('I', '80')
 
-    def enum(self):
-        _, id_ = self.codemap[('I', '80')].first.data.split(' ', 1)
+    @staticmethod
+    def parse_enum(line):
+        '''Return the section number from a section's I80 line.'''
+        _, id_ = line.data.split(' ', 1)
         return id_.strip()
 
+    def enum(self):
+        return self.parse_enum(self.codemap[('I', '80')].first)
+
     history = _subdoc_generator(('I', '53'), ('I', '53'))
     amendments = _subdoc_generator('Amendments')
     derivation = _subdoc_generator('Derivation')
@@ -242,7 +269,7 @@ class Section(Base):
         name = self.data.docs[('I', '89')].first.lines.first
         return re.sub(r'^[\s.]+', '', name.data).strip()
 
-    def body_lines(self):
+    def body_lines(self, split=re.compile(r'\s+').split):
 
         # Test some assumptions...
         assert len(self.data.docs[('I', '89')]) == 1
@@ -255,25 +282,23 @@ class Section(Base):
             if not text.startswith('('):
                 body = text
                 enum = None
-                yield (enum, body, line)
+                yield (enum, body, line, False)
             else:
-                enum_text, body = re.split(r'\s+', text, 1)
-                enums = re.findall(r'\((\S+?)\)', enum_text)
-                enums = map(Enum, enums)
-                for enum in enums[1:]:
-                    enum._was_nested = True
+                enum_text, body = split(text, 1)
+                enums = Enum.get_chain(enum_text)
 
                 # In the case of "(B)(i)(1) blah blah" yield data like:
-                #  (B, None, None)
-                #  (i, None, None)
-                #  (1, blah blah, GPOLocatorCode(...))
-                enums = enums[::-1]
-                while enums:
-                    enum = enums.pop()
-                    if not enums:
-                        yield (enum, body, line)
+                #  (B, None, None, False)
+                #  (i, None, None, True)
+                #  (1, blah blah, GPOLocatorCode(...), True)
+                # where the last item says whether the enum was nested
+                # inside the one before it on the same line.
+                last = len(enums) - 1
+                for n, enum in enumerate(enums):
+                    if n == last:
+                        yield (enum, body, line, bool(n))
                     else:
-                        yield (enum, None, None)
+                        yield (enum, None, None, bool(n))
 
     def misc(self):
         ignored = '''Amendments, Derivation, References In Text,
@@ -285,4 +310,6 @@ class Section(Base):
                 yield k, list(_subdoc_generator(k)(self))
 
     def as_tree(self):
+        if self._tree is not None:
+            return self._tree
         return GPOLocatorParser(self.body_lines()).parse()
@@ -77,15 +77,111 @@ Section 65, R.S. §2037, related to wives and children of colored soldiers.
 I21Section 65, R.S. ÿ1A2037, related to wives and children of colored soldiers.
 '''
 import re
+import mmap
+import cStringIO
 from functools import partial
 from collections import namedtuple
 
+import logbook
+
+
+logger = logbook.Logger('parser')
+
 
 class GPOLocatorText(unicode):
     pass
 
 
-class GPOLocatorLine(namedtuple('GPOLocatorLine', 'code arg data')):
+# A footnote marker in line data, like "General provisions\1\\x07N".
+footnote_ref_rgx = re.compile(r'\\(\d+)\\\x07N')
+
+# The start of a footnote's text (an I28 line), like "\x07N\1\ So in
+# original."
+footnote_note_rgx = re.compile(r'^\x07N\\(\d+)\\\s+')
+
+
+def find_footnote_refs(text, finditer=footnote_ref_rgx.finditer):
+    '''Return a tuple of (number, offset) pairs, one for each footnote
+    marker in `text`.
+    '''
+    return tuple((m.group(1), m.start()) for m in finditer(text))
+
+
+def parse_note(text, match=footnote_note_rgx.match):
+    '''If `text` is a footnote's text ("\\x07N\\2\\ So in original."),
+    return its number and the text without the number. Else None.
+    '''
+    m = match(text)
+    if m:
+        return m.group(1), text[m.end():]
+
+
+class GPOLocatorLine(object):
+    '''A single line of gpo locator data. Behaves like a (code, arg, data)
+    tuple, but the line's raw bytes are only decoded (see `swap`) the
+    first time `data` or `text` is read, so lines that are only ever
+    inspected by code and argument never pay for it. The same goes for
+    the line's footnote markers and, for a footnote's own line, its
+    number and text: each is worked out at most once.
+
+    `raw` is the line's own copy of its bytes (or its text, if it was
+    made from unicode), never a view of the buffer it was tokenized
+    from. Lines outlive that buffer: maps are closed once a title has
+    been read, and a section's tree keeps a handful of lines from a
+    title that may be tens of megabytes.
+    '''
+    __slots__ = ('code', 'arg', 'raw', '_data', '_footnote_refs', '_note',
+                 '_footnote_dict')
+
+    _fields = ('code', 'arg', 'data')
+
+    def __init__(self, code, arg, raw):
+        # Lines are made by the hundred thousand, so this is kept to
+        # plain assignments.
+        self.code = code
+        self.arg = arg
+        self.raw = raw
+        self._data = None
+
+    @property
+    def data(self):
+        data = self._data
+        if data is None:
+            raw = self.raw
+            if raw.__class__ is unicode:
+                data = self._data = raw
+            else:
+                data = self._data = swap(raw)
+        return data
+
+    def __getitem__(self, index, _head=slice(None, 2)):
+        if index == _head:
+            # Grouping looks up every line's codearg this way.
+            return (self.code, self.arg)
+        return (self.code, self.arg, self.data)[index]
+
+    def __iter__(self):
+        yield self.code
+        yield self.arg
+        yield self.data
+
+    def __len__(self):
+        return 3
+
+    def __eq__(self, other):
+        try:
+            return tuple(self) == tuple(other)
+        except TypeError:
+            return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return 'GPOLocatorLine(code=%r, arg=%r, data=%r)' % tuple(self)
 
     def __unicode__(self):
         return self.data
@@ -98,62 +194,101 @@ class GPOLocatorLine(namedtuple('GPOLocatorLine', 'code arg data')):
         return self.code + self.arg
 
     @property
-    def _footnote_numbers(self, finditer=re.finditer):
-        for matchobj in finditer(r'\\(\d)\\', self.data):
-            # number, offset
-            yield matchobj.group(1), matchobj.start()
+    def footnote_refs(self):
+        '''(number, offset) pairs for the footnote markers in `data`.'''
+        try:
+            return self._footnote_refs
+        except AttributeError:
+            refs = self._footnote_refs = find_footnote_refs(self.data)
+            return refs
+
+    @property
+    def note(self):
+        '''If this line is a footnote's text (an I28 line), the footnote's
+        (number, text). Else None.
+        '''
+        try:
+            return self._note
+        except AttributeError:
+            note = self._note = parse_note(self.data)
+            return note
+
+    @property
+    def _footnote_numbers(self):
+        return self.footnote_refs
 
     def footnotes(self):
-        return map(self._footnote_dict.get, self._footnote_numbers)
+        '''The text of each footnote referenced in this line, from the
+        number -> text dict in `_footnote_dict` if one has been set.
+        '''
+        footnote_dict = getattr(self, '_footnote_dict', {})
+        return [footnote_dict.get(number) for number, _ in self.footnote_refs]
 
     @property
     def text(self):
+        '''The line's data without its footnote markers. The referenced
+        footnotes are in its `notes`.
+        '''
         text = self.data
-        for number, offset in self._footnote_numbers:
-            text = text.replace(r'\\%d\\' % number, '')
-
-        text.notes = self.footnotes
+        if self.footnote_refs:
+            text = footnote_ref_rgx.sub('', text)
+        text = GPOLocatorText(text)
+        text.notes = self.footnotes()
         return text
 
+
+class GPOLocatorSpan(namedtuple('GPOLocatorSpan', 'code arg start end')):
+    '''A line record that points into the tokenized buffer instead of
+    holding a copy of the line's data. `start` and `end` are the byte
+    offsets of the data (everything after the code and argument).
+    '''
+    __slots__ = ()
+
+    def as_tuple(self):
+        return self[:2]
+
+    @property
+    def codearg(self):
+        return self.code + self.arg
+
 #-----------------------------------------------------------------------------
 # Step 1: Identify bell codes and their arguments.
+
+# Argument rule for codes whose argument is the rest of the line.
+REST = 'rest'
+
 codes = {
 
-    # Mapping of "bell" code values to patterns matching numeric arguments.
+    # Mapping of "bell" code values to the (min, max) number of digits
+    # in their numeric arguments.
     # Example: '\x07F5880Blah blah blah...'
-    'G': '\d',
-    'I': '\d{2}',
-    'Q': '\d{2}',
-    'R': '\d{2}',
-    'T': '\d',
-    'U': '\d',
-    'Y': '\d',
-    'a': '\d{3}',
-    'g': '\d{3}',
-    'h': '\d',
-    'q': '\d{2}',
-    'F': '\d{4,5}',
-    'S': '\d{4,5}',
+    'G': (1, 1),
+    'H': (1, 1),
+    'I': (2, 2),
+    'Q': (2, 2),
+    'R': (2, 2),
+    'T': (1, 1),
+    'U': (1, 1),
+    'Y': (1, 1),
+    'a': (3, 3),
+    'g': (3, 3),
+    'h': (1, 1),
+    'q': (2, 2),
+    'F': (4, 5),
+    'S': (4, 5),
 
     # These ones never have numeric arguments.
     'K': None,
     'gs': None,
-    '\d{2}': None,
     'j': None,
     'e': None,
 
     # Code 'c' signals data for a complex table. Match the whole line.
-    'c': '.+',
+    'c': REST,
     }
 
-
-# Compile a pattern to match code values.
-re_code = re.compile('|'.join(sorted(codes, reverse=True, key=len)))
-
-# Compile functions to match code arguments.
-for k, v in codes.items():
-    if v:
-        codes[k] = re.compile(v).match
+# Two-digit codes ('\x0712...') never have arguments either.
+codes.update(('%02d' % n, None) for n in range(100))
 
 #-----------------------------------------------------------------------------
 # Step 2: Convert escape sequences to unicode
@@ -212,36 +347,199 @@ swap = partial(_.sub, lambda m: specialchars[m.group()])
 #-----------------------------------------------------------------------------
 # Step 3: Chop each line of the file into code, args, and data.
 
-def getlines(fp, argmatchers=codes, codematcher=re_code.match, swap=swap,
-             GPOLocatorLine=GPOLocatorLine):
-
-    for line in fp:
+def splitline(buf, pos, endpos, codes=codes,
+              digits=frozenset('0123456789')):
+    '''Identify the code and argument of the line occupying
+    buf[pos:endpos]. Return a (code, arg, datastart) tuple, or None if
+    the line doesn't begin with a recognized code. `buf` can be a str
+    or a buffer that slices to str, like an mmap.
+
+    Codes are at most two bytes long, so they're looked up in the code
+    table by their first two bytes, then by their first byte.
+    '''
+    # Get the code value.
+    startpos = pos + 1
+    code = buf[startpos:min(startpos + 2, endpos)]
+    if code not in codes:
+        code = code[:1]
+        if code not in codes:
+            return
+    rule = codes[code]
+
+    # Get the argument value (if any). A code without one is left at the
+    # start of the line's data, as it always has been.
+    if rule is None:
+        return code, None, startpos
+    startpos += len(code)
+
+    if rule is REST:
+        argend = buf.find('\n', startpos, endpos)
+        if argend == -1:
+            argend = endpos
+    else:
+        least, most = rule
+        argend = startpos
+        stop = min(startpos + most, endpos)
+        while argend < stop and buf[argend] in digits:
+            argend += 1
+        if argend - startpos < least:
+            argend = startpos
+
+    if argend == startpos:
+        # The argument is missing or malformed.
+        return
+    return code, buf[startpos:argend], argend
+
+
+def count_unrecognized(counts, buf, pos, endpos):
+    '''Tally a line the tokenizer couldn't identify under its first two
+    bytes after the bell. Blank lines aren't counted.
+    '''
+    if buf[pos:endpos].strip():
+        key = buf[pos + 1:min(pos + 3, endpos)]
+        counts[key] = counts.get(key, 0) + 1
+
+
+def report_unrecognized(counts, name=None):
+    '''Log a summary of the lines skipped because of unknown codes.'''
+    if counts:
+        msg = 'Skipped %d lines with unrecognized codes in %s: %r'
+        logger.warning(msg % (sum(counts.values()), name or '<input>',
+                              dict(counts)))
+
+
+def tokenize_lines(lines, unrecognized, GPOLocatorLine=GPOLocatorLine):
+    '''Yield a GPOLocatorLine for each of `lines`, tallying the ones with
+    unknown codes in the `unrecognized` dict.
+    '''
+    for line in lines:
         if line.strip():
-
-            # Get the code value.
-            startpos = 1
-            matchobj = codematcher(line, startpos)
-            if matchobj:
-                code = matchobj.group()
-            else:
+            res = splitline(line, 0, len(line))
+            if res is None:
+                count_unrecognized(unrecognized, line, 0, len(line))
                 continue
-
-            # Get the argument value (if any)
-            len_code = len(code)
-            argmatcher = argmatchers[code]
-            if not argmatcher:
-                arg = None
-                len_arg = 0
-            else:
-                startpos += len_code
-                arg = argmatcher(line, startpos).group()
-                len_arg = len(arg)
-
-            # Get the data.
-            startpos += len_arg
-            data = line[startpos:]
-
-            yield GPOLocatorLine(code, arg, swap(data))
+            code, arg, datastart = res
+
+            # Get the data; it gets decoded on first access.
+            data = line[datastart:]
+
+            yield GPOLocatorLine(code, arg, data)
+
+
+def getlines(fp, GPOLocatorLine=GPOLocatorLine, mapped=False,
+             unrecognized=None):
+    '''Yield a GPOLocatorLine for each line in `fp`. If `mapped` is
+    true, memory-map the file and read its lines out of the map rather
+    than through the file object.
+
+    Lines with codes missing from the code table are skipped, tallied
+    in the `unrecognized` dict (if one is passed in) and reported once
+    the file is exhausted.
+    '''
+    if mapped:
+        mapping = GPOLocatorMap(fp)
+        try:
+            # The lines hold copies of their bytes, so the map can be
+            # closed as soon as they've all been made.
+            for line in mapping.lines(GPOLocatorLine):
+                yield line
+            if unrecognized is not None:
+                unrecognized.update(mapping.unrecognized)
+        finally:
+            mapping.close()
+        return
+
+    if unrecognized is None:
+        unrecognized = {}
+    for line in tokenize_lines(fp, unrecognized, GPOLocatorLine):
+        yield line
+    report_unrecognized(unrecognized, getattr(fp, 'name', None))
+
+
+def getspans(buf, pos=0, endpos=None, unrecognized=None,
+             GPOLocatorSpan=GPOLocatorSpan):
+    '''Yield a GPOLocatorSpan for each line in buf[pos:endpos]. Nothing
+    but the code and argument gets copied out of `buf`. Lines with
+    unknown codes are tallied in the `unrecognized` dict, if given.
+    '''
+    if endpos is None:
+        endpos = len(buf)
+    find = buf.find
+    while pos < endpos:
+        eol = find('\n', pos, endpos)
+        if eol == -1:
+            eol = endpos
+        else:
+            eol += 1
+        res = splitline(buf, pos, eol)
+        if res is not None:
+            code, arg, datastart = res
+            yield GPOLocatorSpan(code, arg, datastart, eol)
+        elif unrecognized is not None:
+            count_unrecognized(unrecognized, buf, pos, eol)
+        pos = eol
+
+
+class GPOLocatorMap(object):
+    '''A gpo locator file mapped into memory. Iterating over it yields
+    GPOLocatorSpan records; line data is only copied out of the map and
+    decoded when a consumer asks for it.
+
+    >>> m = GPOLocatorMap(open('usc08.10'))
+    >>> span = next(iter(m))
+    >>> span
+    GPOLocatorSpan(code='F', arg='5800', start=6, end=8)
+    >>> m.data(span)
+    u'\r\n'
+
+    After each pass over the file, `unrecognized` maps the leading bytes
+    of any lines with unknown codes to the number of lines skipped.
+    '''
+    def __init__(self, fp):
+        self.name = getattr(fp, 'name', None)
+        self.unrecognized = {}
+        try:
+            self.buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, ValueError, EnvironmentError):
+            # Not a real file (or an empty one); fall back to reading it.
+            self.buf = fp.read()
+
+    def __iter__(self):
+        self.unrecognized = unrecognized = {}
+        for span in getspans(self.buf, unrecognized=unrecognized):
+            yield span
+        report_unrecognized(unrecognized, self.name)
+
+    def raw(self, span):
+        '''Return the span's undecoded data.'''
+        return self.buf[span.start:span.end]
+
+    def data(self, span):
+        '''Return the span's data with escape sequences swapped out.'''
+        return swap(self.buf[span.start:span.end])
+
+    def readlines(self):
+        '''Return an iterator of the lines in the file, each a str.'''
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.seek(0)
+            return iter(self.buf.readline, '')
+        return iter(cStringIO.StringIO(self.buf))
+
+    def lines(self, GPOLocatorLine=GPOLocatorLine):
+        '''Yield a GPOLocatorLine for each line. A line is read out of the
+        map in one piece and tokenized like a line read from a file,
+        which is quicker than slicing its code, argument and data out of
+        the map separately.
+        '''
+        self.unrecognized = unrecognized = {}
+        for line in tokenize_lines(self.readlines(), unrecognized,
+                                   GPOLocatorLine):
+            yield line
+        report_unrecognized(unrecognized, self.name)
+
+    def close(self):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
 
 
 if __name__ == "__main__":
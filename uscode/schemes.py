@@ -18,7 +18,6 @@ Use it like this:
 '''
 import re
 import operator
-import itertools
 import collections
 
 
@@ -33,7 +32,7 @@ _digits = '123456789'
 def romans():
     '''Produce data for roman numeral schemes.'''
     ones = ('', 'i', 'ii', 'iii', 'iv', 'v', 'vi', 'vii', 'viii', 'ix')
-    tens = ('', 'x', 'xx', 'xxx', 'l')
+    tens = ('', 'x', 'xx', 'xxx', 'xl', 'l')
     res = []
     for x in tens:
         res += [x + y for y in ones]
@@ -80,6 +79,77 @@ _all_scheme_tokens = reduce(operator.or_, _schemes.values())
 # corresponding changes to the other, so complain and fail.
 assert len(_schemes) == len(_first_scheme_tokens)
 
+# Text to ordinal maps for each scheme, replacing _schemes_lists[s].index.
+_ordinals = dict(
+    (k, dict((t, i) for i, t in enumerate(v)))
+    for k, v in _schemes_lists.items()
+    )
+
+# Roman numerals in canonical form, of any size.
+_roman_rgx = re.compile(
+    r'^(?=[mdclxvi])m*(cm|cd|d?c{0,3})(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})$')
+_roman_values = dict(m=1000, d=500, c=100, l=50, x=10, v=5, i=1)
+
+
+def _roman_value(text):
+    '''
+    Return the value of the canonical lowercase roman numeral ``text``,
+    or raise ValueError.
+    '''
+    if not _roman_rgx.match(text):
+        raise ValueError('%r is not a roman numeral' % text)
+    values = [_roman_values[c] for c in text]
+    total = 0
+    for n, value in enumerate(values):
+        if n + 1 < len(values) and value < values[n + 1]:
+            total -= value
+        else:
+            total += value
+    return total
+
+
+def _digits_ordinal(text):
+    if not text.isdigit() or text[0] == '0':
+        raise ValueError('%r is not a positive integer' % text)
+    return int(text) - 1
+
+
+def _lower_roman_ordinal(text):
+    if not text.islower():
+        raise ValueError('%r is not a lowercase roman numeral' % text)
+    return _roman_value(text) - 1
+
+
+def _upper_roman_ordinal(text):
+    if not text.isupper():
+        raise ValueError('%r is not an uppercase roman numeral' % text)
+    return _roman_value(text.lower()) - 1
+
+
+# Schemes with no upper limit, whose ordinals are computed when the
+# text isn't in the tables above.
+_computed_ordinals = {
+    'digits':      _digits_ordinal,
+    'lower_roman': _lower_roman_ordinal,
+    'upper_roman': _upper_roman_ordinal,
+    }
+
+
+def get_ordinal(scheme, text, ordinals=_ordinals):
+    '''
+    Return the position of ``text`` in ``scheme``. The same as
+    ``_schemes_lists[scheme].index(text)``, except that digits and roman
+    numerals go on past the end of those lists. Raises ValueError if
+    ``text`` isn't in the scheme.
+    '''
+    try:
+        return ordinals[scheme][text]
+    except KeyError:
+        compute = _computed_ordinals.get(scheme)
+        if compute is None:
+            raise ValueError('%r is not in scheme %r' % (text, scheme))
+        return compute(text)
+
 
 #-----------------------------------------------------------------------------
 #  Scheme identification helpers.
@@ -116,13 +186,45 @@ class SchemeEntity(object):
     schemes = None
     ordinality = None
 
+    def _precompute(self):
+        '''
+        Cache the schemes and ordinality now, if they can be had. Any
+        error is left to be raised when they're asked for.
+        '''
+        try:
+            self.get_schemes()
+            self.get_ordinality()
+        except (UnrecognizedSchemeError, ValueError, TypeError):
+            pass
+
 
 class Token(SchemeEntity):
 
+    # Shared instances handed out by Token.get, keyed by text.
+    _interned = {}
+    _interned_max = 1 << 12
+
     def __init__(self, t):
 
         self.text = t
 
+    @classmethod
+    def get(cls, t):
+        '''
+        Return a shared Token for the text ``t``, with its schemes and
+        ordinality already worked out. Don't modify it.
+        '''
+        interned = cls._interned
+        try:
+            return interned[t]
+        except KeyError:
+            token = cls(t)
+            token._precompute()
+            if len(interned) >= cls._interned_max:
+                interned.clear()
+            interned[t] = token
+            return token
+
     def __repr__(self):
         return self.text
 
@@ -153,7 +255,7 @@ class Token(SchemeEntity):
         This function is lengthy in an attempt to optimize it, it possibly
         being worst performing aspect of parsing statutes.
         '''
-        if self.schemes:
+        if self.schemes is not None:
             return self.schemes
 
         t = self.text
@@ -201,9 +303,15 @@ class Token(SchemeEntity):
                         {2: 'doubles', 3: 'triples', 4: 'quads'}[tlen]
                         ))
 
-                # Test if it's upper_roman.
-                if t in schemes['%s_roman' % case]:
-                    res.append('%s_roman' % case)
+                # Test if it's upper_roman. Tokens in the tables are
+                # roman only if the roman table says so (cc is a double,
+                # not 200); longer numerals are checked by form.
+                roman = '%s_roman' % case
+                if t in _all_scheme_tokens:
+                    if t in schemes[roman]:
+                        res.append(roman)
+                elif _roman_rgx.match(t.lower() if case == 'upper' else t):
+                    res.append(roman)
 
                 res = set(res)
                 self.schemes = res
@@ -229,14 +337,13 @@ class Token(SchemeEntity):
         ordinality within each scheme as the corresponding value.
         '''
         _ord = self.ordinality
-        if _ord:
+        if _ord is not None:
             return _ord
         else:
             t = self.text
             _ord = {}
-            _schemes_lists = self._schemes_lists
             for sc in self.get_schemes():
-                _ord[sc] = _schemes_lists[sc].index(t)
+                _ord[sc] = get_ordinal(sc, t)
             self.ordinality = _ord
             return _ord
 
@@ -291,6 +398,10 @@ class Enum(list, SchemeEntity):
         '''
         pass
 
+    # Shared instances handed out by Enum.get, keyed by text.
+    _interned = {}
+    _interned_max = 1 << 12
+
     #-------------------------------------------------------------------------
     #  Token extraction regexes.
     #-------------------------------------------------------------------------
@@ -302,6 +413,14 @@ class Enum(list, SchemeEntity):
         re.compile(r'\.$'),             # points
         )
 
+    # Splits stripped enum text into its alpha, number and connector
+    # tokens in one left-to-right pass. Once the parens and points have
+    # been stripped, this finds the same tokens as ``rgxs``.
+    token_rgx = re.compile(r'[A-Za-z]+|[\d.]+|-+')
+
+    # Finds the enums in a chain like "(B)(i)(1)".
+    chain_rgx = re.compile(r'\((\S+?)\)')
+
     def __init__(self, text, **kwargs):
         '''
         :param text: the enum text (not stripped of punctuation)
@@ -317,8 +436,8 @@ class Enum(list, SchemeEntity):
           * Cache any parenthesis or punctuation surrounding the enum tokens
             for use in later comparison and formatting operations, since some
             statutes incorporate enum style in defining the document hierarchy
-          * Find all match objects for self.rgxs and sort them by start()
-          * Extend self, a list, with the sorted matches
+          * Split the rest into tokens with self.token_rgx
+          * Extend self, a list, with the tokens
           * Cache self.text, which appears to be redundant of original text.
         '''
         # A quick test to verify that no unrecognized tokens are present,
@@ -347,35 +466,64 @@ class Enum(list, SchemeEntity):
         format_right = []
 
         if text:
-            first_char = text[0]
-            while first_char in '(':
-                format_left.append(first_char)
-                text = text[1:]
-                first_char = text[0]
-
-            last_char = text[-1]
-            while last_char in '.)':
-                format_right.append(last_char)
-                text = text[:-1]
-                last_char = text[-1]
+            stripped = text.lstrip('(')
+            format_left = list(text[:len(text) - len(stripped)])
+            text = stripped.rstrip('.)')
+            # Right-hand formatting is recorded innermost last.
+            format_right = list(reversed(stripped[len(text):]))
+            if not text:
+                # Nothing but formatting.
+                raise IndexError('string index out of range')
 
         self.format_left = format_left
         self.format_right = format_right
 
-        # Get all match strings.
-        matches = itertools.chain.from_iterable(
-            m.finditer(text) for m in self.rgxs
-            )
-
-        # Sort by start position and wrap in Token class.
-        matches = [Token(m.group()) for m in
-                   sorted(matches, key=lambda m: m.start())]
-
-        super(Enum, self).__init__(matches)
+        # Wrap each token in the Token class.
+        get_token = Token.get
+        super(Enum, self).__init__(
+            [get_token(t) for t in self.token_rgx.findall(text)])
 
         # Cache text in instance.
         self.text = text
 
+    @classmethod
+    def get(cls, text):
+        '''
+        Return a shared Enum for ``text``, with its schemes and ordinality
+        already worked out. The same few hundred enum texts occur over and
+        over, so this is much cheaper than ``Enum(text)``. Since every
+        occurrence of ``text`` gets the same instance, don't modify it or
+        store anything about a particular occurrence on it.
+        '''
+        interned = cls._interned
+        try:
+            return interned[text]
+        except KeyError:
+            enum = cls(text)
+            enum._precompute()
+            if len(interned) >= cls._interned_max:
+                interned.clear()
+            interned[text] = enum
+            return enum
+
+    @classmethod
+    def get_many(cls, texts):
+        '''
+        Return a list of shared Enums (see ``get``), one for each of
+        ``texts``.
+        '''
+        interned = cls._interned
+        get = cls.get
+        return [interned[t] if t in interned else get(t) for t in texts]
+
+    @classmethod
+    def get_chain(cls, text):
+        '''
+        Return a list of shared Enums for the enums in a chain like
+        "(B)(i)(1)", in order.
+        '''
+        return cls.get_many(cls.chain_rgx.findall(text))
+
     def __repr__(self):
         return 'Enum(\'%s\')' % self.text
 
@@ -444,7 +592,7 @@ class Enum(list, SchemeEntity):
         Note that for compound tabs, this function
         bails after determining the scheme of the first token.
         '''
-        if self.schemes:
+        if self.schemes is not None:
             return self.schemes
         else:
             for t in self:
@@ -467,7 +615,7 @@ class Enum(list, SchemeEntity):
 
         # Try returning cached value.
         ordinality = self.ordinality
-        if ordinality:
+        if ordinality is not None:
             return ordinality
 
         text = self.text
@@ -476,7 +624,7 @@ class Enum(list, SchemeEntity):
         ordinality = collections.defaultdict(lambda: [])
         for s in self.get_schemes():
             try:
-                ord_ = _schemes_lists[s].index(text)
+                ord_ = get_ordinal(s, text)
             except ValueError:
                 pass
             else:
@@ -491,7 +639,7 @@ class Enum(list, SchemeEntity):
             for t in tokens:
                 for sc in t.get_schemes():
                     try:
-                        ord_ = _schemes_lists[sc].index(t.text)
+                        ord_ = get_ordinal(sc, t.text)
                     except ValueError:
                         continue
                     ordinality[s].append(ord_)
@@ -538,15 +686,146 @@ class Enum(list, SchemeEntity):
                 continue
         return True
 
-    @property
-    def was_nested(self):
+#-----------------------------------------------------------------------------
+#  Memoized transitions.
+#-----------------------------------------------------------------------------
+# Whether one enum could be next after another depends only on their
+# texts, and only a few thousand distinct enum texts occur in the Code,
+# so the parser's answers are cached here by (previous, next) text.
+_transitions = {}
+_transitions_max = 1 << 16
+
+
+def could_be_next(prev, next_, transitions=_transitions):
+    '''
+    Memoized ``next_.could_be_next_after(prev)`` for two Enums. Like the
+    method, raises AttributeError if ``next_`` is None.
+    '''
+    key = (prev.text, next_.text)
+    try:
+        return transitions[key]
+    except KeyError:
+        if len(transitions) >= _transitions_max:
+            transitions.clear()
+        res = transitions[key] = next_.could_be_next_after(prev)
+        return res
+
+#-----------------------------------------------------------------------------
+#  Batch API, for classifying a whole title's enums at once. Needs numpy.
+#-----------------------------------------------------------------------------
+# Bit j of a scheme mask is set if the enum could be in scheme_names[j].
+scheme_names = sorted(_schemes_lists)
+
+
+def _classify(texts):
+    '''
+    Classify the distinct enum texts in the numpy object array ``texts``
+    one at a time (using the interned Enums), since there are only a few
+    thousand of them. Returns the arrays:
+
+      * inverse  - for each text, the index of its distinct text
+      * masks    - the scheme mask of each distinct text
+      * ordinals - its ordinal in each scheme in scheme_names, or -1
+      * ids      - an id for its stripped enum text, which Enum equality
+                   compares
+      * simple   - whether it's a single token whose ordinals are all
+                   known, so that could_be_next_after can be vectorized
+    '''
+    import numpy as np
+
+    uniq, inverse = np.unique(texts, return_inverse=True)
+    count = len(uniq)
+    masks = np.zeros(count, dtype=np.uint16)
+    ordinals = np.empty((count, len(scheme_names)), dtype=np.int64)
+    ordinals.fill(-1)
+    ids = np.empty(count, dtype=np.int64)
+    simple = np.zeros(count, dtype=bool)
+    text_ids = {}
+    for i, text in enumerate(uniq):
         try:
-            was_nested = self._was_nested
-        except AttributeError:
-            return False
-        else:
-            if was_nested:
-                return True
+            enum = Enum.get(text)
+        except (Enum.UnrecognizedTokenError, IndexError):
+            # Not an enum at all: no schemes, and equal only to itself.
+            ids[i] = text_ids.setdefault((text,), len(text_ids))
+            continue
+        ids[i] = text_ids.setdefault(enum.text, len(text_ids))
+        try:
+            schemes = enum.get_schemes() or ()
+            ordinality = enum.get_ordinality() if schemes else {}
+        except UnrecognizedSchemeError:
+            continue
+        known = True
+        for j, name in enumerate(scheme_names):
+            if name not in schemes:
+                continue
+            masks[i] |= 1 << j
+            if ordinality.get(name):
+                ordinals[i, j] = ordinality[name][0]
+            else:
+                known = False
+        simple[i] = (known and len(enum) == 1 and
+                     enum[0].text == enum.text)
+    return inverse, masks, ordinals, ids, simple
+
+
+def get_schemes_many(texts):
+    '''
+    Classify a sequence of enum texts in one call. Returns two numpy
+    arrays: a uint16 scheme mask for each text (bit j is set if
+    ``scheme_names[j]`` is in ``Enum(text).get_schemes()``) and an
+    (n, len(scheme_names)) array of ordinals, with -1 wherever the text
+    has no ordinal in that scheme. Compound enums like "4-a" get the
+    ordinal of their first token. Texts whose scheme can't be determined,
+    including ones that aren't enums at all (like "$"), get a mask of 0
+    and ordinals of -1 rather than failing the batch.
+    '''
+    import numpy as np
+
+    texts = np.asarray(texts, dtype=object).ravel()
+    if not len(texts):
+        return (np.zeros(0, dtype=np.uint16),
+                np.zeros((0, len(scheme_names)), dtype=np.int64))
+    inverse, masks, ordinals, ids, simple = _classify(texts)
+    return masks[inverse], ordinals[inverse]
+
+
+def could_be_next_many(prev_texts, next_texts):
+    '''
+    Vectorized ``Enum(next).could_be_next_after(Enum(prev))`` over
+    aligned sequences of enum texts; returns a numpy bool array. Pairs of
+    single-token enums (nearly all of them) are decided with array
+    operations; the rest fall back to the memoized ``could_be_next``,
+    and raise whatever it raises.
+    '''
+    import numpy as np
+
+    prev_texts = np.asarray(prev_texts, dtype=object).ravel()
+    next_texts = np.asarray(next_texts, dtype=object).ravel()
+    if len(prev_texts) != len(next_texts):
+        raise ValueError('Got %d previous enums but %d next enums.' % (
+            len(prev_texts), len(next_texts)))
+    count = len(prev_texts)
+    if not count:
+        return np.zeros(0, dtype=bool)
+
+    inverse, masks, ordinals, ids, simple = _classify(
+        np.concatenate([prev_texts, next_texts]))
+    prev, next_ = inverse[:count], inverse[count:]
+
+    # Could be next in some scheme both enums could be in.
+    bits = (1 << np.arange(len(scheme_names))).astype(np.uint16)
+    common = ((masks[prev] & masks[next_])[:, None] & bits) != 0
+    prev_ord, next_ord = ordinals[prev], ordinals[next_]
+    consecutive = (next_ord - prev_ord == 1) & (prev_ord >= 0)
+    res = (common & consecutive).any(axis=1)
+
+    # An enum is never next after itself.
+    res &= ids[prev] != ids[next_]
+
+    get = Enum.get
+    for i in np.flatnonzero(~(simple[prev] & simple[next_])):
+        res[i] = bool(could_be_next(get(prev_texts[i]), get(next_texts[i])))
+    return res
 
 if __name__ == '__main__':
     
@@ -0,0 +1,401 @@
+'''
+Snapshots of parsed titles.
+
+Grouping a title and parsing each of its sections takes far longer than
+reading the result back, and most editions of the Code never change, so
+the result is saved as a snapshot in a cache directory and reused for as
+long as the input is the same. A snapshot is keyed by the sha1 of the
+input file along with this module's VERSION and PARSER_VERSION, so
+changing the input or the parser leaves old snapshots unused until
+they're evicted.
+
+A snapshot holds:
+
+  * the title's lines, as columns of codes, arguments and raw data
+  * the (start, stop, subdocs, id) range of each top-level document
+  * the parse tree of each section document, as a flat preorder list
+    of node records
+
+and is written with marshal (compressed with zlib) rather than pickle,
+so that loading one never runs any code. It's preceded by a one-line
+header giving the versions and the sha1, so a snapshot can be checked
+without decompressing it.
+
+Usage:
+
+>>> lines, documents, trees = load_snapshot('usc08.11')
+'''
+import os
+import zlib
+import marshal
+
+import logbook
+
+from .parser import GPOLocatorLine
+from .grouper import Document, group
+from .schemes import Enum
+from .structure import Node, TextNode, preorder
+from .models import Section
+from .index import file_hash
+from .utils import mkdir_p, replacing
+
+
+logger = logbook.Logger('snapshot')
+
+MAGIC = 'uscode-snapshot'
+
+# Bump this whenever the layout of a snapshot changes.
+VERSION = 2
+
+# Bump this whenever a change to the tokenizer, grouper, models or parser
+# changes what they produce for the same input.
+PARSER_VERSION = 2
+
+# Where snapshots are kept, and how big the cache can get before the
+# least recently used snapshots are evicted.
+CACHE_DIR = 'data/cache/snapshots'
+MAX_BYTES = 1 << 30
+
+SUFFIX = '.snap'
+
+
+class SnapshotFormatError(Exception):
+    '''Raised when a snapshot can't be read with this version of the code.
+    '''
+    pass
+
+
+#-----------------------------------------------------------------------------
+# Encoding and decoding.
+
+def encode_tree(root, line_numbers):
+    '''Flatten the tree under `root` into a tuple of node records, in
+    preorder. A Node's record is (enum text, line number or -1,
+    footnotes, number of children); a TextNode's is (content, number of
+    children). `line_numbers` maps id(line) to the line's number.
+    '''
+    records = []
+    for node in preorder(root):
+        if isinstance(node, Node):
+            enum = node.enum
+            linedata = node.linedata
+            records.append((
+                None if enum is None else enum.original_text,
+                -1 if linedata is None else line_numbers[id(linedata)],
+                tuple((note['number'], note['offset'], note['text'])
+                      for note in node.footnotes),
+                len(node)))
+        else:
+            records.append((node.content, len(node)))
+    return tuple(records)
+
+
+def decode_tree(records, lines):
+    '''Rebuild a tree flattened by `encode_tree`.'''
+    get_enum = Enum.get
+    root = None
+    # (node, number of children still to come) for each open node.
+    stack = []
+    for record in records:
+        if len(record) == 4:
+            enum_text, lineno, footnotes, children = record
+            parent = stack[-1][0] if stack else None
+            node = Node(None if enum_text is None else get_enum(enum_text),
+                        None if lineno < 0 else lines[lineno],
+                        parent=parent)
+            node.footnotes = [dict(number=number, offset=offset, text=text)
+                              for number, offset, text in footnotes]
+        else:
+            content, children = record
+            node = TextNode(content)
+
+        if stack:
+            list.append(stack[-1][0], node)
+            stack[-1][1] -= 1
+        else:
+            root = node
+        if children:
+            stack.append([node, children])
+        while stack and not stack[-1][1]:
+            stack.pop()
+    return root
+
+
+def encode(documents, trees, sha1=None):
+    '''Return the snapshot of a title's grouped `documents` (which share
+    one list of lines) and the parse `trees` of some of them, keyed by
+    document number, as a string.
+    '''
+    lines = documents[0]._lines if documents else []
+    line_numbers = dict((id(line), n) for n, line in enumerate(lines))
+    codes, args, raws = [], [], []
+    for line in lines:
+        codes.append(line.code)
+        args.append(line.arg)
+        raws.append(line.raw)
+
+    encoded_trees = {}
+    for n, tree in trees.items():
+        try:
+            encoded_trees[n] = encode_tree(tree, line_numbers)
+        except KeyError:
+            # A node points at a line that isn't in the title; leave it
+            # to be parsed again.
+            logger.warning('Not saving the tree of document %d.' % n)
+
+    snapshot = (
+        (tuple(codes), tuple(args), tuple(raws)),
+        tuple((doc.start, doc.stop, tuple(doc.subdocs), doc.id)
+              for doc in documents),
+        encoded_trees,
+        )
+    header = '%s %d %d %s\n' % (MAGIC, VERSION, PARSER_VERSION, str(sha1))
+    return header + zlib.compress(marshal.dumps(snapshot), 1)
+
+
+def read_header(data):
+    '''Check the header of a snapshot. Returns the sha1 it records and
+    the offset at which the snapshot proper begins.
+    '''
+    end = data.find('\n', 0, 200)
+    fields = data[:end].split(' ') if end != -1 else []
+    if len(fields) != 4 or fields[0] != MAGIC:
+        raise SnapshotFormatError('Malformed snapshot header.')
+    versions = tuple(fields[1:3])
+    if versions != (str(VERSION), str(PARSER_VERSION)):
+        raise SnapshotFormatError('Snapshot version %r is not %r.' % (
+            versions, (VERSION, PARSER_VERSION)))
+    return fields[3], end + 1
+
+
+def decode(data):
+    '''Return the (lines, documents, trees) saved in a snapshot.'''
+    sha1, start = read_header(data)
+    try:
+        snapshot = marshal.loads(zlib.decompress(data[start:]))
+        (codes, args, raws), ranges, encoded_trees = snapshot
+        lines = map(GPOLocatorLine, codes, args, raws)
+        documents = [Document(lines, start, stop, subdocs, id)
+                     for start, stop, subdocs, id in ranges]
+        trees = dict((n, decode_tree(records, lines))
+                     for n, records in encoded_trees.items())
+    except (zlib.error, ValueError, EOFError, TypeError, KeyError,
+            IndexError, AttributeError) as e:
+        # A payload that passed the header check but is corrupt.
+        raise SnapshotFormatError('Malformed snapshot: %r' % e)
+    return lines, documents, trees
+
+
+def parse_title(lines):
+    '''Group `lines` and parse every section. Returns the documents and
+    a dict of the section trees by document number; sections that fail
+    to parse are left out.
+    '''
+    documents = group(lines)
+    trees = {}
+    for n, doc in enumerate(documents):
+        if doc.first_code != Section.applies_to:
+            continue
+        try:
+            trees[n] = doc.instance.as_tree()
+        except Exception as e:
+            logger.info('Not saving document %d, which failed to parse: '
+                        '%r' % (n, e))
+    return documents, trees
+
+
+#-----------------------------------------------------------------------------
+# The cache.
+
+def content_hash(filename):
+    '''Return the sha1 of `filename`. (A sidecar's sha1 is only trusted
+    after hashing the file anyway, so there's nothing to gain from it.)
+    '''
+    return file_hash(filename)
+
+
+def snapshot_filename(sha1, cache_dir=CACHE_DIR):
+    name = '%s-%d.%d%s' % (sha1, VERSION, PARSER_VERSION, SUFFIX)
+    return os.path.join(cache_dir, name)
+
+
+def read_snapshot(sha1, cache_dir=CACHE_DIR):
+    '''Return the (lines, documents, trees) in the snapshot for `sha1`,
+    or None if there isn't a usable one.
+    '''
+    path = snapshot_filename(sha1, cache_dir)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except IOError:
+        return
+    try:
+        res = decode(data)
+    except SnapshotFormatError as e:
+        logger.info('Ignoring unreadable snapshot %r: %s' % (path, e))
+        return
+    try:
+        # Mark it as recently used.
+        os.utime(path, None)
+    except OSError:
+        pass
+    return res
+
+
+def save_snapshot(sha1, documents, trees, cache_dir=CACHE_DIR,
+                  max_bytes=MAX_BYTES):
+    '''Save the snapshot for `sha1`, then evict old snapshots to keep the
+    cache under `max_bytes`. Failure to write it is logged, not raised.
+    Returns the snapshot's data.
+    '''
+    data = encode(documents, trees, sha1)
+    path = snapshot_filename(sha1, cache_dir)
+    try:
+        mkdir_p(cache_dir)
+        with replacing(path) as f:
+            f.write(data)
+    except EnvironmentError as e:
+        logger.warning('Couldn\'t write snapshot %r: %r' % (path, e))
+        return data
+    evict(cache_dir, max_bytes)
+    return data
+
+
+def load_snapshot(filename, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    '''Return the (lines, documents, trees) of the title in `filename`,
+    from its snapshot if there is one. Otherwise parse the title and
+    save a snapshot of it.
+    '''
+    sha1 = content_hash(filename)
+    res = read_snapshot(sha1, cache_dir)
+    if res is not None:
+        return res
+
+    # Imported here, since the package imports this module.
+    from . import lines_for
+
+    logger.info('Parsing %r for a snapshot' % filename)
+    documents, trees = parse_title(lines_for(filename))
+    save_snapshot(sha1, documents, trees, cache_dir, max_bytes)
+    lines = documents[0]._lines if documents else []
+    return lines, documents, trees
+
+
+def snapshot_data(filename, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    '''Return the data of the snapshot of `filename` without decoding
+    it, parsing the title and saving a snapshot first if need be. This
+    is what a worker process hands back (see uscode.edition), since it's
+    much smaller than the objects it encodes.
+    '''
+    sha1 = content_hash(filename)
+    path = snapshot_filename(sha1, cache_dir)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except IOError:
+        pass
+    else:
+        try:
+            read_header(data)
+        except SnapshotFormatError as e:
+            logger.info('Ignoring unreadable snapshot %r: %s' % (path, e))
+        else:
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+            return data
+
+    from . import lines_for
+
+    logger.info('Parsing %r for a snapshot' % filename)
+    documents, trees = parse_title(lines_for(filename))
+    return save_snapshot(sha1, documents, trees, cache_dir, max_bytes)
+
+
+def make_snapshot(filename, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    '''Make sure `filename` has a usable snapshot, parsing the title and
+    saving one if it doesn't. Only the header of an existing snapshot is
+    read.
+    '''
+    sha1 = content_hash(filename)
+    path = snapshot_filename(sha1, cache_dir)
+    try:
+        with open(path, 'rb') as f:
+            read_header(f.read(256))
+    except IOError:
+        pass
+    except SnapshotFormatError as e:
+        logger.info('Ignoring unreadable snapshot %r: %s' % (path, e))
+    else:
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return
+
+    from . import lines_for
+
+    logger.info('Parsing %r for a snapshot' % filename)
+    documents, trees = parse_title(lines_for(filename))
+    save_snapshot(sha1, documents, trees, cache_dir, max_bytes)
+
+
+def snapshots(cache_dir=CACHE_DIR):
+    '''Return (path, size, last used) for each snapshot in the cache,
+    least recently used first.
+    '''
+    res = []
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return res
+    for name in names:
+        if not name.endswith(SUFFIX):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        res.append((path, st.st_size, st.st_mtime))
+    res.sort(key=lambda item: item[2])
+    return res
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    '''Remove the least recently used snapshots until the cache is no
+    bigger than `max_bytes`. Returns the paths removed.
+    '''
+    items = snapshots(cache_dir)
+    total = sum(size for path, size, used in items)
+    removed = []
+    for path, size, used in items:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed.append(path)
+    return removed
+
+
+def clear(cache_dir=CACHE_DIR, filename=None):
+    '''Remove every snapshot, or just the snapshots of `filename`'s
+    current contents (under any version). Returns the paths removed.
+    '''
+    prefix = None
+    if filename is not None:
+        prefix = content_hash(filename) + '-'
+    removed = []
+    for path, size, used in snapshots(cache_dir):
+        if prefix and not os.path.basename(path).startswith(prefix):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        removed.append(path)
+    return removed
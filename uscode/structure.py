@@ -1,23 +1,30 @@
 import os
-import re
+import json
+from json.encoder import encode_basestring_ascii
 from os.path import join
-from itertools import count
+from itertools import count, imap
+from collections import deque
 
 import logbook
 
-from .utils import CachedAttribute
-from .schemes import Enum
+from .schemes import Enum, could_be_next
+from .parser import find_footnote_refs, parse_note
 
 
 logger = logbook.Logger()
 
 
 class Token(object):
-
-    def __init__(self, enum, text, linedata):
+    '''One enum occurrence in a section body. Enums are shared between
+    occurrences (see schemes.Enum.get), so anything particular to this
+    one, like whether it was nested in the enum before it on the same
+    line, is kept here.
+    '''
+    def __init__(self, enum, text, linedata, was_nested=False):
         self.enum = enum
         self.text = text
         self.linedata = linedata
+        self.was_nested = was_nested
 
     def __iter__(self):
         for x in (self.enum, self.text, self.linedata):
@@ -32,50 +39,117 @@ class Token(object):
 
 
 class Stream(object):
-
-    def __init__(self, iterable):
-        self._stream = map(Token.make, iterable)
-        self.i = 0
+    '''The parser's token source. Tokens are made from `iterable` only
+    as the parser gets to them (or looks ahead to them), and only the
+    last `history` tokens are kept for looking behind, so the whole
+    input never has to be held in memory.
+    '''
+    def __init__(self, iterable, history=16):
+        self._tokens = imap(Token.make, iterable)
+        self._ahead = deque()
+        self._behind = deque(maxlen=history)
+        self._this = None
+        self.i = -1
 
     def __iter__(self):
-        self.i = -1
-        while True:
-            self.i += 1
-            try:
-                yield self._stream[self.i]
-            except IndexError:
-                raise StopIteration
+        return self
 
     def next(self):
-        i = self.i + 1
-        try:
-            yield self._stream[i]
-        except IndexError:
-            raise StopIteration
+        '''Advance to and return the next token.'''
+        if self._ahead:
+            token = self._ahead.popleft()
+        else:
+            token = next(self._tokens)
+        if self.i >= 0:
+            self._behind.append(self._this)
+        self._this = token
+        self.i += 1
+        return token
 
     def previous(self):
         return self.behind(1)
 
     def this(self):
-        return self._stream[self.i]
+        if self.i < 0:
+            raise IndexError('The stream has not been started.')
+        return self._this
 
     def ahead(self, n):
-        return self._stream[self.i + n]
+        '''Return the token `n` places after the current one, reading
+        it in if need be. Raises IndexError past the end of the stream.
+        '''
+        if n <= 0:
+            return self.behind(-n)
+        ahead = self._ahead
+        while len(ahead) < n:
+            try:
+                ahead.append(next(self._tokens))
+            except StopIteration:
+                raise IndexError('Lookahead past the end of the stream.')
+        return ahead[n - 1]
 
     def behind(self, n):
-        return self._stream[self.i - n]
+        '''Return the token `n` places before the current one. Raises
+        IndexError if it's before the start of the stream or no longer
+        in the history.
+        '''
+        if n <= 0:
+            return self.ahead(-n) if n else self.this()
+        if n > len(self._behind):
+            raise IndexError('Lookbehind past the stream history.')
+        return self._behind[-n]
+
+
+def walk(node):
+    '''Walk the tree rooted at `node` without recursing, yielding
+    (event, node, depth) triples: ('start', node, depth) when a node is
+    entered and ('end', node, depth) once all its children have been.
+    '''
+    yield 'start', node, 0
+    stack = [(node, iter(node))]
+    while stack:
+        for child in stack[-1][1]:
+            yield 'start', child, len(stack)
+            stack.append((child, iter(child)))
+            break
+        else:
+            node, _ = stack.pop()
+            yield 'end', node, len(stack)
+
+
+def preorder(node):
+    '''Yield each node in the tree rooted at `node`, parents first.'''
+    for event, node, depth in walk(node):
+        if event == 'start':
+            yield node
+
+
+def postorder(node):
+    '''Yield each node in the tree rooted at `node`, children first.'''
+    for event, node, depth in walk(node):
+        if event == 'end':
+            yield node
 
 
 class BaseNode(list):
 
+    __slots__ = ()
+
     def filesystem_dump(self, path, root=True):
-        text_counter = count()
-        for node in self:
+        # One text counter per node on the current path from the root.
+        counters = []
+        for event, node, depth in walk(self):
+            if event == 'end':
+                continue
+            del counters[depth:]
+            counters.append(count())
+            if not depth:
+                continue
 
             if isinstance(node, TextNode):
 
                 # Unenumerate, single child (a.k.a, top-level section text).
-                filename = 'text' + str(next(text_counter))
+                filename = 'text' + str(next(counters[depth - 1]))
                 filename = join(path, filename)
                 logger.info('Writing text to %s' % filename)
                 with open(filename, 'w') as f:
@@ -88,56 +162,131 @@ class BaseNode(list):
                     newdir = join(path, str(node.enum.text))
                     os.mkdir(newdir)
 
-            node.filesystem_dump(path, root=False)
+    def json(self):
+        # Each open node on the path from the root collects its
+        # children's dicts until it's closed.
+        subs = [[]]
+        for event, node, depth in walk(self):
+            if event == 'start':
+                subs.append([])
+            else:
+                data = node._json_head()
+                data['sub'] = subs.pop()
+                subs[-1].append(data)
+        return subs[0][0]
+
+    def write_json(self, fp, indent=2, encode=encode_basestring_ascii):
+        '''Write the tree to `fp` as JSON, one node at a time, without
+        building the nested dicts `json` returns. The output is the same
+        as json.dump(self.json(), fp, sort_keys=True, indent=indent); if
+        `indent` is None it's compact, with no whitespace at all.
+        '''
+        if indent is None:
+            item_sep, key_sep = ',', ':'
+            newline = lambda level: ''
+        else:
+            item_sep, key_sep = ', ', ': '
+            newline = lambda level: '\n' + ' ' * (indent * level)
+
+        def write_fields(fields, level):
+            for n, (key, value) in enumerate(fields):
+                if n:
+                    write(item_sep)
+                write(newline(level))
+                write(encode(key))
+                write(key_sep)
+                if value is None:
+                    write('null')
+                elif isinstance(value, basestring):
+                    write(encode(value))
+                else:
+                    write(json.dumps(value, sort_keys=True))
+
+        write = fp.write
+        # For each open node, whether it's written a child yet and the
+        # fields that sort after 'sub', which are written when it closes.
+        started = []
+        tails = []
+        for event, node, depth in walk(self):
+            level = 2 * depth
+            if event == 'start':
+                if started:
+                    if started[-1]:
+                        write(item_sep)
+                    started[-1] = True
+                    write(newline(level))
+                fields = sorted(node._json_head().items())
+                head = [item for item in fields if item[0] < 'sub']
+                tails.append([item for item in fields if item[0] > 'sub'])
+                write('{')
+                write_fields(head, level + 1)
+                if head:
+                    write(item_sep)
+                write(newline(level + 1))
+                write('"sub"')
+                write(key_sep)
+                write('[' if len(node) else '[]')
+                started.append(False)
+            else:
+                started.pop()
+                if len(node):
+                    write(newline(level + 1))
+                    write(']')
+                tail = tails.pop()
+                if tail:
+                    write(item_sep)
+                    write_fields(tail, level + 1)
+                write(newline(level))
+                write('}')
 
 
 class TextNode(BaseNode):
     '''A text node can (sometimes) have children.'''
 
+    __slots__ = ('content',)
+
     def __init__(self, content):
         self.content = content
 
     def __repr__(self):
         return 'TextNode(%r)' % self.content
 
-    def json(self):
-        return {'type': 'textnode',
-                'content': self.content,
-                'sub': [node.json() for node in self]}
+    def _json_head(self):
+        return {'type': 'textnode', 'content': self.content}
 
 
 class Node(BaseNode):
+    '''A node in the parse tree. Each node points back to its `parent`
+    (None for the root), so `append` can move back up the tree, and to
+    the `parser` building it, so it can look ahead in the token stream.
+    '''
+    __slots__ = ('enum', 'linedata', 'footnotes', 'parent', 'parser')
 
-    def __init__(self, enum, linedata, text=None):
+    def __init__(self, enum, linedata, text=None, parent=None, parser=None):
         self.enum = enum
         self.linedata = linedata
         self.footnotes = []
+        self.parent = parent
+        self.parser = parser
         if text:
-            content = [TextNode(text)]
-        else:
-            content = []
-        self.extend(content)
-        self.logger = logbook.Logger(level='DEBUG')
+            list.append(self, TextNode(text))
 
     def __repr__(self):
         return 'Node(%r, %s)' % (self.enum, list.__repr__(self))
 
-    @CachedAttribute
-    def _new_child(self):
-        '''Return a subclass of this class where the attribute `parent`
-        points back to this class, enabling `append` to recursively
-        move back up the tree structure if necessary.
-        '''
-        self_cls = self.__class__
-        attrs = dict(parent=self)
-        cls = type(self_cls.__name__, (self_cls,), attrs)
-        return cls
+    @property
+    def is_root(self):
+        return self.parent is None
+
+    @property
+    def stream(self):
+        return self.parser.stream
 
     def _force_append(self, token, listappend=list.append):
         '''Append a child node without attempting to judge whether it
         fits or propagating it back up the tree.'''
         enum, text, linedata = token
-        new_node = self._new_child(enum, linedata, text)
+        new_node = self.__class__(enum, linedata, text, self, self.parser)
 
         # Append the new node to the parent.
         listappend(self, new_node)
@@ -149,98 +298,110 @@ class Node(BaseNode):
     def append(self, token,
                h=Enum('h'), H=Enum('H'),
                i=Enum('i'), I=Enum('I'),
-               j=Enum('j'), J=Enum('J')):
+               j=Enum('j'), J=Enum('J'), could_be_next=could_be_next):
 
         enum, text, linedata = token
-        self_enum = self.enum
+        node = self
 
-        try:
-            is_root = self.is_root
-        except AttributeError:
-            pass
-        else:
-            if is_root:
+        # Walk back up the tree until some node will take the token.
+        while True:
+            self_enum = node.enum
+
+            if node.parent is None:
                 if enum:
-                    return self._force_append(token)
+                    return node._force_append(token)
 
-        if enum is None:
-            return self._force_append(token)
+            if enum is None:
+                return node._force_append(token)
 
-        if enum.is_first_in_scheme():
+            if enum.is_first_in_scheme():
 
-            # Disambiguate roman and alpahabetic 'i' and 'I'
-            if enum == i and self_enum == h:
-                # If the next enum is 'ii', the scheme is probably
-                # 'lower_roman'.
-                next_ = self.parser.stream.ahead(1)
-                if next_.enum.could_be_next_after(enum):
-                    return self.parent._force_append(token)
+                # Disambiguate roman and alpahabetic 'i' and 'I'
+                if enum == i and self_enum == h:
+                    # If the next enum is 'ii', the scheme is probably
+                    # 'lower_roman'.
+                    next_ = node.parser.stream.ahead(1)
+                    if could_be_next(enum, next_.enum):
+                        return node.parent._force_append(token)
 
-                # Else if it's 'j', it's probably just 'lower'.
-                if next_.enum == j:
-                    return self.parent._force_append(token)
+                    # Else if it's 'j', it's probably just 'lower'.
+                    if next_.enum == j:
+                        return node.parent._force_append(token)
 
-            elif enum == I and self_enum == H:
+                elif enum == I and self_enum == H:
 
-                # If the next enum is 'II', the scheme is probably
-                # 'upper_roman'.
-                next_ = self.parser.stream.ahead(1)
-                if next_.enum.could_be_next_after(enum):
-                    return self.parent._force_append(token)
+                    # If the next enum is 'II', the scheme is probably
+                    # 'upper_roman'.
+                    next_ = node.parser.stream.ahead(1)
+                    if could_be_next(enum, next_.enum):
+                        return node.parent._force_append(token)
 
-                # Else if it's 'J', it's probably just 'upper'.
-                if next_.enum == J:
-                    return self.parent._force_append(token)
+                    # Else if it's 'J', it's probably just 'upper'.
+                    if next_.enum == J:
+                        return node.parent._force_append(token)
 
-            return self._force_append(token)
+                return node._force_append(token)
 
-        if enum.was_nested:
-            return self._force_append(token)
+            if token.was_nested:
+                return node._force_append(token)
 
-        if self_enum is None:
-            self.parent._force_append(token)
+            if self_enum is None:
+                node.parent._force_append(token)
 
-        elif enum.could_be_next_after(self_enum):
-            return self.parent._force_append(token)
+            elif could_be_next(self_enum, enum):
+                return node.parent._force_append(token)
 
-        # If we get here, the previous append attempts all failed,
-        # so propagate this node up to the current node's parent
-        # and start over.
-        return self.parent.append(token)
+            # If we get here, the previous append attempts all failed,
+            # so propagate this node up to the current node's parent
+            # and start over.
+            node = node.parent
 
-    def tree(self, indent=0):
-        if self.linedata:
-            print ' ' * indent, self.enum  # '[{0}, {1}]'.format(*self.linedata)
-            # if 16 < int(self.linedata.arg):
-            #     import pdb;pdb.set_trace()
-        else:
-            print ' ' * indent, self.enum
-        if self.footnotes:
-            for note in self.footnotes:
-                print 'NOTE:', note['number'], note['offset'],repr(note['text'])
-        for node in self:
+    def _dump_children(self, indent):
+        '''Return (node, indent) pairs for the children `tree` and
+        `filedump` visit next, in reverse order for popping off a stack.
+        Child nodes are indented a level; text is at the parent's level.
+        '''
+        res = []
+        for node in reversed(self):
             if isinstance(node, Node):
-                node.tree(indent=indent + 2)
+                res.append((node, indent + 2))
             elif isinstance(node, TextNode):
+                res.append((node, indent))
+        return res
+
+    def tree(self, indent=0):
+        stack = [(self, indent)]
+        while stack:
+            node, indent = stack.pop()
+            if isinstance(node, TextNode):
                 if node.content is not None:
                     print ' ' * indent, node.content.encode('utf-8')
+                continue
+            if node.linedata:
+                print ' ' * indent, node.enum  # '[{0}, {1}]'.format(*node.linedata)
+            else:
+                print ' ' * indent, node.enum
+            if node.footnotes:
+                for note in node.footnotes:
+                    print 'NOTE:', note['number'], note['offset'],repr(note['text'])
+            stack.extend(node._dump_children(indent))
 
     def filedump(self, fp, indent=0):
-
-        fp.write(' ' * indent)
-        if self.enum:
-            fp.write('(%s)' % self.enum.text)  # '[{0}, {1}]'.format(*self.linedata)
-        for node in self:
-            if isinstance(node, Node):
-                node.filedump(fp, indent=indent + 2)
-            elif isinstance(node, TextNode):
+        stack = [(self, indent)]
+        while stack:
+            node, indent = stack.pop()
+            if isinstance(node, TextNode):
                 if node.content is not None:
                     fp.write(' ')
                     fp.write(node.content.encode('utf-8'))
+                continue
+            fp.write(' ' * indent)
+            if node.enum:
+                fp.write('(%s)' % node.enum.text)  # '[{0}, {1}]'.format(*node.linedata)
+            stack.extend(node._dump_children(indent))
 
-
-    def json(self):
-        return dict(type='node', sub=[node.json() for node in self])
+    def _json_head(self):
+        return dict(type='node')
 
 
 class Parser(object):
@@ -249,10 +410,7 @@ class Parser(object):
 
     def __init__(self, stream):
         stream = Stream(stream)
-        node_cls = type('Node', (Node,), dict(stream=stream, parser=self))
-        root = node_cls(None, None, None)
-        root.is_root = True
-        self.root = root
+        self.root = Node(None, None, None, parser=self)
         self.stream = stream
 
     def parse(self):
@@ -299,7 +457,7 @@ class GPOLocatorParser(Parser):
         # they appear.
         self.footnotes = {}
 
-    def before_append(self, token, finditer=re.finditer):
+    def before_append(self, token):
 
         SKIPPED = 1
         codemap = self.codemap
@@ -328,11 +486,20 @@ class GPOLocatorParser(Parser):
             if codearg == 'I28':
                 return SKIPPED
 
-        # Associate nodes with footnotes they contain.
-        if token.text:
-            for matchobj in finditer(r'\\(\d+)\\\x07N', token.text):
-                number, offset = self.matchobj_to_notedata(token, matchobj)
-                self.footnotes[number] = (token, offset)
+        # Associate nodes with footnotes they contain. The markers were
+        # found when the line was tokenized; the token's text is the end
+        # of the line's, after any enum, so shift their offsets to match.
+        text = token.text
+        if text:
+            if linedata is not None and linedata.data.endswith(text):
+                refs = linedata.footnote_refs
+                shift = len(linedata.data) - len(text)
+            else:
+                refs = find_footnote_refs(text)
+                shift = 0
+            for number, offset in refs:
+                if offset >= shift:
+                    self.footnotes[number] = (token, offset - shift)
 
     def after_append(self, token):
 
@@ -343,19 +510,21 @@ class GPOLocatorParser(Parser):
             target_token.node.footnotes.append(note)
 
     #  methods.
-    def matchobj_to_notedata(self, token, matchobj):
-        offset = matchobj.start()
-        number = matchobj.group(1)
-        return number, offset
-
     def token_to_note(self, token):
         text = token.text
 
         # If the text doesn't start with\x07, it's not a note.
         assert text[0] == '\x07'
 
-        number = text[3]
+        linedata = token.linedata
+        if linedata is not None and linedata.data == text:
+            note = linedata.note
+        else:
+            note = parse_note(text)
+        if note is None:
+            number = text[3]
+        else:
+            number, text = note
         target_token, offset = self.footnotes[number]
-        text = re.sub(r'^\x07N\\(\d+)\\\s+', '', text)
         note = dict(offset=offset, text=text, number=number)
         return target_token, note
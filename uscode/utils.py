@@ -1,4 +1,7 @@
+import os
+import errno
 from operator import itemgetter
+from contextlib import contextmanager
 
 ## {{{ http://code.activestate.com/recipes/276643/ (r1)
 class CachedAttribute(object):
@@ -32,4 +35,32 @@ class NiceList(list):
     fifth = property(itemgetter(4))
     sixth = property(itemgetter(5))
 
-    rest = property(itemgetter(slice(1, None)))
\ No newline at end of file
+    rest = property(itemgetter(slice(1, None)))
+
+
+def mkdir_p(path):
+    try:
+        os.makedirs(path)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+
+
+@contextmanager
+def replacing(path):
+    '''Open a temporary file next to `path` for writing, and move it into
+    place once the block is done, so readers never see a half-written
+    file. If anything goes wrong, the temporary file is removed and the
+    error raised.
+    '''
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(tmp, 'wb') as f:
+            yield f
+        os.rename(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise